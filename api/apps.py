@@ -8,3 +8,6 @@ class ApiConfig(AppConfig):
     def ready(self):
         # This import ensures that your central admin.py is loaded after apps are ready.
         import api.admin
+
+        # Maintains the item rank tables (see api.relationships.ranks)
+        import api.relationships.signals
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brands', '0003_alter_brand_name'),
+        ('items', '0007_remove_item_unique_item_constraint_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['price', 'id'], name='item_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['brand', 'id'], name='item_brand_id_idx'),
+        ),
+    ]
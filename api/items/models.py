@@ -20,3 +20,10 @@ class Item(models.Model):
                 name="unique_item_constraint",
             )
         ]
+        # Match the (sort key, id) orderings of cursor pagination
+        indexes = [
+            models.Index(fields=["price", "id"], name="item_price_id_idx"),
+            models.Index(fields=["brand", "id"], name="item_brand_id_idx"),
+            models.Index(fields=["brand", "price"], name="item_brand_price_idx"),
+            models.Index(fields=["size"], name="item_size_idx"),
+        ]
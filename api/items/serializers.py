@@ -24,6 +24,8 @@ class ItemFilterSerializer(serializers.ModelSerializer):
 
     Expects a 'filter_color_id' in the serializer context, and returns only
     the best matching color (sorted by euclidean_distance) for that filter.
+    If the view prefetched the matching colors into 'filtered_colors' (see
+    ItemViewSet), they are used instead of querying each item's colors.
     """
 
     brand = BrandSerializer(read_only=True)
@@ -42,6 +44,13 @@ class ItemFilterSerializer(serializers.ModelSerializer):
         ]
 
     def get_colors(self, obj):
+        filtered_colors = getattr(obj, "filtered_colors", None)
+        if filtered_colors is not None:
+            # Already filtered and sorted by euclidean_distance
+            return ItemColorSerializer(
+                filtered_colors[:1], many=True, context=self.context
+            ).data
+
         filter_color_id = self.context.get("filter_color_id")
         qs = obj.item_colors.all()  # Using the related name "item_colors"
         if filter_color_id:
@@ -56,7 +65,9 @@ class ItemSeasonFilterSerializer(serializers.ModelSerializer):
     """Serializes an item with its attributes and season-filtered colors field.
 
     Expects a 'season_id' in the serializer context, and returns only
-    the colors that belong to that season.
+    the colors that belong to that season. If the view prefetched the
+    season's colors into 'filtered_colors' (see ItemViewSet), they are
+    used instead of querying each item's colors.
     """
 
     brand = BrandSerializer(read_only=True)
@@ -75,6 +86,12 @@ class ItemSeasonFilterSerializer(serializers.ModelSerializer):
         ]
 
     def get_colors(self, obj):
+        filtered_colors = getattr(obj, "filtered_colors", None)
+        if filtered_colors is not None:
+            return ItemColorSerializer(
+                filtered_colors, many=True, context=self.context
+            ).data
+
         season_id = self.context.get("season_id")
         if season_id:
             qs = obj.item_colors.filter(color__color_seasons__season_id=season_id)
@@ -99,3 +116,31 @@ class ItemSerializer(serializers.ModelSerializer):
             "colors",
             "product_id",
         ]
+
+
+class ItemColorIngestionSerializer(serializers.Serializer):
+    """Validates one color of an item sent to the bulk ingestion route."""
+
+    item_url = serializers.URLField(max_length=200, allow_blank=True)
+    color_id = serializers.IntegerField()
+    euclidean_distance = serializers.FloatField()
+    real_rgb = serializers.CharField(max_length=20)
+
+
+class ItemIngestionSerializer(serializers.Serializer):
+    """Validates one item, with its colors, sent to the bulk ingestion route."""
+
+    description = serializers.CharField(allow_blank=True)
+    price = serializers.FloatField()
+    brand = serializers.CharField(max_length=50)
+    product_url = serializers.CharField(allow_blank=True)
+    product_id = serializers.CharField()
+    colors = ItemColorIngestionSerializer(many=True, allow_empty=False)
+
+    def validate_colors(self, colors):
+        keys = [(color["color_id"], color["real_rgb"]) for color in colors]
+        if len(set(keys)) != len(keys):
+            raise serializers.ValidationError(
+                "Duplicate (color_id, real_rgb) pairs in the item's colors."
+            )
+        return colors
@@ -0,0 +1,140 @@
+import json
+import random
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from api.brands.models import Brand
+from api.color.models import Color
+from api.items.models import Item
+from api.relationships.models import (
+    ItemColor,
+    ItemColorRank,
+    ItemSeasonRank,
+    SeasonColor,
+)
+from api.relationships.ranks import rebuild_ranks
+from api.season.models import Season
+
+# Tables growing with the catalog, which the filter endpoints must never scan
+# sequentially
+CATALOG_TABLES = [Item, ItemColor, ItemColorRank, ItemSeasonRank]
+
+
+def seq_scanned_tables(plan):
+    """Returns the tables scanned sequentially by a node of an EXPLAIN plan."""
+    tables = set()
+    if plan["Node Type"] == "Seq Scan":
+        tables.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        tables |= seq_scanned_tables(child)
+    return tables
+
+
+class QueryPlanTests(APITestCase):
+    """Requests the item filter endpoints in cursor mode on a seeded catalog,
+    large enough for the planner to prefer indexes, and checks with EXPLAIN
+    that none of their queries scans a catalog table sequentially."""
+
+    n_items = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        brands = Brand.objects.bulk_create(Brand(name=f"brand-{i}") for i in range(50))
+        colors = Color.objects.bulk_create(
+            Color(name=f"color-{i}", code=f"color-{i}") for i in range(300)
+        )
+        seasons = Season.objects.bulk_create(
+            Season(name=f"season-{i}") for i in range(4)
+        )
+        SeasonColor.objects.bulk_create(
+            SeasonColor(season=season, color=color)
+            for color in colors
+            for season in rng.sample(seasons, 2)
+        )
+
+        items = Item.objects.bulk_create(
+            Item(
+                price=rng.uniform(5, 500),
+                size=rng.choice(["XS", "S", "M", "L", "XL"]),
+                description=f"Item {i}",
+                product_url=f"https://example.com/{i}",
+                product_id=f"product-{i}",
+                brand=rng.choice(brands),
+            )
+            for i in range(cls.n_items)
+        )
+        ItemColor.objects.bulk_create(
+            ItemColor(
+                item=item,
+                color=color,
+                image_url=f"https://example.com/{item.id}.jpg",
+                euclidean_distance=rng.uniform(0, 100),
+                real_rgb=f"[{item.id} {color.id}]",
+            )
+            for item in items
+            for color in rng.sample(colors, 3)
+        )
+        # bulk_create doesn't send the signals maintaining the ranks
+        rebuild_ranks()
+
+        with connection.cursor() as cursor:
+            for model in [Brand, Color, Season, SeasonColor, *CATALOG_TABLES]:
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+        cls.user = get_user_model().objects.create_user("user")
+        cls.color, cls.season, cls.brand = colors[0], seasons[0], brands[0]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assert_no_seq_scans(self, url):
+        """Requests the first two pages of url, the second one filtered by the
+        cursor, and checks the plans of all their queries."""
+        catalog_tables = {model._meta.db_table for model in CATALOG_TABLES}
+        for page in ["first page", "second page"]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+            for query in queries.captured_queries:
+                with connection.cursor() as cursor:
+                    cursor.execute("EXPLAIN (FORMAT JSON) " + query["sql"])
+                    plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                tables = seq_scanned_tables(plan[0]["Plan"]) & catalog_tables
+                self.assertFalse(tables, f"{page}: {query['sql']}")
+
+            url = response.json()["next"]
+            self.assertIsNotNone(url)
+
+    def test_filter_by_color(self):
+        self.assert_no_seq_scans(
+            f"/items/filter_by_color/{self.color.id}/?pagination=cursor"
+        )
+
+    def test_filter_by_season(self):
+        self.assert_no_seq_scans(
+            f"/items/filter_by_season/{self.season.id}/?pagination=cursor"
+        )
+
+    def test_filter_by_brand(self):
+        self.assert_no_seq_scans(
+            f"/items/filter_by_brand/{self.brand.id}/?pagination=cursor"
+        )
+
+    def test_filter_items(self):
+        queries = [
+            f"color_id={self.color.id}&order_by=euclidean_distance",
+            f"season_id={self.season.id}&order_by=euclidean_distance",
+            f"brand_id={self.brand.id}&order_by=price",
+            "order_by=price",
+            "size=M",
+        ]
+        for query in queries:
+            with self.subTest(query):
+                self.assert_no_seq_scans(
+                    f"/items/filter_items/?{query}&pagination=cursor"
+                )
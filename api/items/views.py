@@ -1,12 +1,13 @@
 from concurrent.futures import ThreadPoolExecutor
 from rest_framework import serializers
 from django.db import transaction, IntegrityError
-from django.db.models import Prefetch, Min
+from django.db.models import F, Prefetch
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
 from rest_framework import viewsets
 from api.permissions import IsAuthenticatedReadOrAdminWrite
+from api.pagination import KeysetPagination
 import logging
 import numpy as np
 from drf_spectacular.utils import (
@@ -19,16 +20,60 @@ from .models import Item
 from api.brands.models import Brand
 from api.color.models import Color
 from api.relationships.models import ItemColor
+from api.relationships.ranks import refresh_item_ranks
 from .serializers import (
     ItemSerializer,
     ItemFilterSerializer,
     ItemSeasonFilterSerializer,
+    ItemIngestionSerializer,
 )
 from rest_framework.pagination import PageNumberPagination
 from django.db import models
 
 logger = logging.getLogger("api.items")
 
+# Maximum number of items accepted by a bulk ingestion request
+BULK_INGESTION_MAX_ITEMS = 1000
+
+CURSOR_PAGINATION_PARAMETERS = [
+    OpenApiParameter(
+        name=KeysetPagination.mode_query_param,
+        description="Set to 'cursor' for cursor pagination, without page count",
+        required=False,
+        type=str,
+    ),
+    OpenApiParameter(
+        name=KeysetPagination.cursor_query_param,
+        description="Cursor of the page, taken from the 'next' link of the previous one",
+        required=False,
+        type=str,
+    ),
+]
+
+
+def color_prefetch(color_id=None):
+    """Prefetches each item's colors matching color_id (all of them if None),
+    sorted by euclidean_distance and with their color joined, into the item's
+    'filtered_colors' attribute, read by ItemFilterSerializer."""
+    item_colors = ItemColor.objects.select_related("color").order_by(
+        "euclidean_distance"
+    )
+    if color_id is not None:
+        item_colors = item_colors.filter(color_id=color_id)
+    return Prefetch("item_colors", queryset=item_colors, to_attr="filtered_colors")
+
+
+def season_prefetch(season_id):
+    """Prefetches each item's colors belonging to season_id, with their color
+    joined, into the item's 'filtered_colors' attribute, read by
+    ItemSeasonFilterSerializer."""
+    item_colors = (
+        ItemColor.objects.filter(color__color_seasons__season_id=season_id)
+        .select_related("color")
+        .order_by("id")
+    )
+    return Prefetch("item_colors", queryset=item_colors, to_attr="filtered_colors")
+
 
 class ItemViewSet(viewsets.ModelViewSet):
     queryset = Item.objects.all().order_by("id")
@@ -36,6 +81,17 @@ class ItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedReadOrAdminWrite]
     pagination_class = PageNumberPagination
 
+    @property
+    def paginator(self):
+        """Page number pagination, unless the request opts into cursor
+        pagination (see KeysetPagination)."""
+        if not hasattr(self, "_paginator"):
+            if KeysetPagination.is_requested(self.request):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -43,7 +99,8 @@ class ItemViewSet(viewsets.ModelViewSet):
                 description="The ID of the color to filter by",
                 required=True,
                 type=int,
-            )
+            ),
+            *CURSOR_PAGINATION_PARAMETERS,
         ]
     )
     @action(detail=False, methods=["get"], url_path="filter_by_color/(?P<color_id>\d+)")
@@ -62,13 +119,16 @@ class ItemViewSet(viewsets.ModelViewSet):
                 {"error": "Invalid color id"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Filter items that have at least one associated ItemColor with this color id,
-        # order them by the euclidean_distance from that relation, and eliminate duplicates.
+        # Filter items that have at least one associated ItemColor with this color id
+        # and order them by the euclidean_distance from that relation, read from the
+        # item's rank for the color (a single row per item, see ItemColorRank).
         items = (
             self.get_queryset()
-            .filter(item_colors__color__id=color_id)
-            .distinct()
-            .order_by("item_colors__euclidean_distance")
+            .filter(color_ranks__color_id=color_id)
+            .annotate(color_distance=F("color_ranks__euclidean_distance"))
+            .order_by("color_distance")
+            .select_related("brand")
+            .prefetch_related(color_prefetch(color_id))
         )
 
         page = self.paginate_queryset(items)
@@ -84,7 +144,8 @@ class ItemViewSet(viewsets.ModelViewSet):
                 description="The ID of the brand to filter by",
                 required=True,
                 type=int,
-            )
+            ),
+            *CURSOR_PAGINATION_PARAMETERS,
         ]
     )
     @action(detail=False, methods=["get"], url_path="filter_by_brand/(?P<brand_id>\d+)")
@@ -102,7 +163,13 @@ class ItemViewSet(viewsets.ModelViewSet):
                 {"error": "Invalid brand id"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        items = self.get_queryset().filter(brand__id=brand_id).distinct()
+        items = (
+            self.get_queryset()
+            .filter(brand__id=brand_id)
+            .distinct()
+            .select_related("brand")
+            .prefetch_related(color_prefetch())
+        )
 
         page = self.paginate_queryset(items)
         serializer = ItemFilterSerializer(
@@ -146,7 +213,6 @@ class ItemViewSet(viewsets.ModelViewSet):
         """,
     )
     def create(self, request, *args, **kwargs):
-        print(f"🔎 DEBUG: Request headers received: {request.headers}")
         brand_name = request.data.get("brand")
         brand, _ = Brand.objects.get_or_create(name=brand_name)
 
@@ -185,6 +251,173 @@ class ItemViewSet(viewsets.ModelViewSet):
             logger.error("Error creating item", exc_info=True)
             return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @extend_schema(
+        request=ItemIngestionSerializer(many=True),
+        responses={
+            200: inline_serializer(
+                name="ItemBulkIngestionResult",
+                fields={
+                    "results": serializers.ListField(
+                        child=serializers.DictField(),
+                        help_text="Status of each item, in the order of the request",
+                    )
+                },
+            )
+        },
+        description=f"""
+            Bulk ingestion route: takes in a POST request with a JSON list of at most
+            {BULK_INGESTION_MAX_ITEMS} items, each with:
+            - **description** (string)
+            - **price** (float)
+            - **brand** (string)
+            - **product_url** (string)
+            - **product_id** (string)
+            - **colors** (list of objects with **item_url**, **color_id**,
+              **euclidean_distance** and **real_rgb**)
+
+            Items are upserted by product_id and their colors by (color_id, real_rgb).
+            The response holds a result for each item, in the order of the request:
+            its product_id, a status ('created', 'updated' or 'error'), and either the
+            item's id or the errors of the row. Invalid rows don't prevent the others
+            from being ingested.
+        """,
+    )
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {"error": "Expected a list of items"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(rows) > BULK_INGESTION_MAX_ITEMS:
+            return Response(
+                {"error": f"At most {BULK_INGESTION_MAX_ITEMS} items per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(rows)
+        valid_rows = []
+        product_ids = set()
+        for index, row in enumerate(rows):
+            serializer = ItemIngestionSerializer(data=row)
+            if not serializer.is_valid():
+                errors = serializer.errors
+            elif serializer.validated_data["product_id"] in product_ids:
+                errors = {"product_id": ["Duplicate product_id in the request."]}
+            else:
+                product_ids.add(serializer.validated_data["product_id"])
+                valid_rows.append((index, serializer.validated_data))
+                continue
+            results[index] = {
+                "product_id": row.get("product_id") if isinstance(row, dict) else None,
+                "status": "error",
+                "errors": errors,
+            }
+
+        # Resolve the colors of all rows in one query
+        color_ids = {
+            color["color_id"] for _, data in valid_rows for color in data["colors"]
+        }
+        known_color_ids = set(
+            Color.objects.filter(id__in=color_ids).values_list("id", flat=True)
+        )
+        rows_to_ingest = []
+        for index, data in valid_rows:
+            unknown_color_ids = sorted(
+                {color["color_id"] for color in data["colors"]} - known_color_ids
+            )
+            if unknown_color_ids:
+                results[index] = {
+                    "product_id": data["product_id"],
+                    "status": "error",
+                    "errors": {"colors": [f"Unknown color ids: {unknown_color_ids}"]},
+                }
+            else:
+                rows_to_ingest.append((index, data))
+
+        try:
+            with transaction.atomic():
+                brands = self.resolve_brands(
+                    {data["brand"] for _, data in rows_to_ingest}
+                )
+                existing_product_ids = set(
+                    Item.objects.filter(
+                        product_id__in=[
+                            data["product_id"] for _, data in rows_to_ingest
+                        ]
+                    ).values_list("product_id", flat=True)
+                )
+
+                # Upsert the items, then their colors, in a single query each
+                items = Item.objects.bulk_create(
+                    [
+                        Item(
+                            description=data["description"],
+                            price=data["price"],
+                            brand=brands[data["brand"]],
+                            product_url=data["product_url"],
+                            product_id=data["product_id"],
+                        )
+                        for _, data in rows_to_ingest
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["product_id"],
+                    update_fields=["description", "price", "brand", "product_url"],
+                )
+                ItemColor.objects.bulk_create(
+                    [
+                        ItemColor(
+                            item=item,
+                            color_id=color["color_id"],
+                            image_url=color["item_url"],
+                            euclidean_distance=color["euclidean_distance"],
+                            real_rgb=color["real_rgb"],
+                        )
+                        for item, (_, data) in zip(items, rows_to_ingest)
+                        for color in data["colors"]
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["item", "real_rgb", "color"],
+                    update_fields=["image_url", "euclidean_distance"],
+                )
+                # bulk_create doesn't send the signals maintaining the ranks
+                refresh_item_ranks([item.id for item in items])
+
+        except Exception:
+            logger.error("Error during bulk item ingestion", exc_info=True)
+            return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        for item, (index, data) in zip(items, rows_to_ingest):
+            results[index] = {
+                "product_id": data["product_id"],
+                "status": (
+                    "updated"
+                    if data["product_id"] in existing_product_ids
+                    else "created"
+                ),
+                "id": item.id,
+            }
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def resolve_brands(self, names):
+        """Returns the brands with the given names by name, creating the missing ones."""
+        brands = {brand.name: brand for brand in Brand.objects.filter(name__in=names)}
+        missing_names = names - brands.keys()
+        if missing_names:
+            # Ignore brands created concurrently, and read them back with the new ones
+            Brand.objects.bulk_create(
+                [Brand(name=name) for name in missing_names], ignore_conflicts=True
+            )
+            brands.update(
+                {
+                    brand.name: brand
+                    for brand in Brand.objects.filter(name__in=missing_names)
+                }
+            )
+        return brands
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -217,6 +450,7 @@ class ItemViewSet(viewsets.ModelViewSet):
                 required=False,
                 type=str,
             ),
+            *CURSOR_PAGINATION_PARAMETERS,
         ],
         responses=ItemFilterSerializer,
         description="""
@@ -226,6 +460,8 @@ class ItemViewSet(viewsets.ModelViewSet):
           - size: filter items with the given size.
           - season_id: filter items by season id.
           - order_by: order the result by 'euclidean_distance' (if filtering by color) or by 'price'.
+          - pagination: 'cursor' to paginate with a cursor instead of page numbers, which stays
+            fast when scrolling deep into the results; follow the 'next' link for further pages.
           
         Note: If both color_id and season_id are provided, color_id takes precedence.
         """,
@@ -259,14 +495,11 @@ class ItemViewSet(viewsets.ModelViewSet):
         if color_id:
             try:
                 color_id = int(color_id)
-                qs = qs.filter(item_colors__color_id=color_id)
+                qs = qs.filter(color_ranks__color_id=color_id)
                 if order_by == "euclidean_distance":
                     # Use the euclidean distance for the specific color
                     qs = qs.annotate(
-                        color_distance=models.Min(
-                            "item_colors__euclidean_distance",
-                            filter=models.Q(item_colors__color_id=color_id),
-                        )
+                        color_distance=F("color_ranks__euclidean_distance")
                     ).order_by("color_distance")
             except ValueError:
                 return Response(
@@ -276,16 +509,11 @@ class ItemViewSet(viewsets.ModelViewSet):
         elif season_id:
             try:
                 season_id = int(season_id)
-                qs = qs.filter(item_colors__color__color_seasons__season_id=season_id)
+                qs = qs.filter(season_ranks__season_id=season_id)
                 if order_by == "euclidean_distance":
                     # Use the minimum euclidean distance among colors in the season
                     qs = qs.annotate(
-                        min_season_distance=models.Min(
-                            "item_colors__euclidean_distance",
-                            filter=models.Q(
-                                item_colors__color__color_seasons__season_id=season_id
-                            ),
-                        )
+                        min_season_distance=F("season_ranks__euclidean_distance")
                     ).order_by("min_season_distance")
             except ValueError:
                 return Response(
@@ -300,7 +528,8 @@ class ItemViewSet(viewsets.ModelViewSet):
                     min_distance=models.Min("item_colors__euclidean_distance")
                 ).order_by("min_distance")
 
-        qs = qs.distinct()
+        # Color and season filters join a single rank row per item, so that no
+        # DISTINCT is needed
 
         # Apply price ordering if requested and not already ordered by distance
         if order_by == "price":
@@ -316,6 +545,21 @@ class ItemViewSet(viewsets.ModelViewSet):
         if season_id and not color_id:
             serializer_context["season_id"] = season_id
 
+        # Join brands and prefetch the colors each serializer returns, so that
+        # serializing a page takes a constant number of queries
+        qs = qs.select_related("brand")
+        if color_id:
+            qs = qs.prefetch_related(color_prefetch(color_id))
+        elif season_id:
+            qs = qs.prefetch_related(season_prefetch(season_id))
+        else:
+            qs = qs.prefetch_related(
+                Prefetch(
+                    "item_colors",
+                    queryset=ItemColor.objects.select_related("color").order_by("id"),
+                )
+            )
+
         page = self.paginate_queryset(qs)
         # Use ItemSerializer when no color/season filter to show all colors
         if not color_id and not season_id:
@@ -338,7 +582,8 @@ class ItemViewSet(viewsets.ModelViewSet):
                 description="The ID of the season to filter by",
                 required=True,
                 type=int,
-            )
+            ),
+            *CURSOR_PAGINATION_PARAMETERS,
         ]
     )
     @action(
@@ -360,9 +605,10 @@ class ItemViewSet(viewsets.ModelViewSet):
 
         items = (
             self.get_queryset()
-            .filter(item_colors__color__color_seasons__season_id=season_id)
-            .distinct()
+            .filter(season_ranks__season_id=season_id)
             .order_by("id")
+            .select_related("brand")
+            .prefetch_related(season_prefetch(season_id))
         )
 
         page = self.paginate_queryset(items)
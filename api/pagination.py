@@ -0,0 +1,120 @@
+import base64
+import binascii
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination for infinite scrolling, opted into per request with
+    ?pagination=cursor. Pages are sorted by the first ordering field of the
+    queryset (a model field or an annotation, in ascending order) and then by
+    id, and the cursor encodes the (sort key, id) pair of the last item of the
+    page: the next page is fetched with a WHERE (or HAVING, for aggregates)
+    clause on that pair instead of an OFFSET, and no COUNT is run. Responses
+    only contain the link to the next page and the results.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            request.query_params.get(cls.mode_query_param) == "cursor"
+            or cls.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = queryset.query.order_by or ("id",)
+        self.sort_key = ordering[0]
+
+        if self.sort_key.startswith("-") or "__" in self.sort_key:
+            raise ValueError(
+                "Keyset pagination requires an ascending ordering on a field "
+                f"or an annotation of the queryset, got '{self.sort_key}'."
+            )
+
+        if self.sort_key == "id":
+            queryset = queryset.order_by("id")
+        else:
+            queryset = queryset.order_by(self.sort_key, "id")
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self.after_cursor(*cursor))
+            except (ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # One extra item tells whether there is a next page
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def after_cursor(self, value, last_id):
+        """Condition selecting the items following (value, last_id), with
+        NULL sort keys last as in PostgreSQL's ascending order."""
+        if self.sort_key == "id":
+            return Q(id__gt=last_id)
+        if value is None:
+            return Q(**{f"{self.sort_key}__isnull": True, "id__gt": last_id})
+        return (
+            Q(**{f"{self.sort_key}__gt": value})
+            | Q(**{self.sort_key: value, "id__gt": last_id})
+            | Q(**{f"{self.sort_key}__isnull": True})
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            value, last_id = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # Sort keys are numbers (or NULL), and ids integers: anything else
+        # comes from a tampered cursor
+        if not (value is None or is_number(value)) or type(last_id) is not int:
+            raise NotFound(self.invalid_cursor_message)
+        return value, last_id
+
+    def encode_cursor(self, item):
+        value = None if self.sort_key == "id" else getattr(item, self.sort_key)
+        return base64.urlsafe_b64encode(json.dumps([value, item.id]).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from api.relationships.models import ItemColorRank, ItemSeasonRank
+from api.relationships.ranks import rebuild_ranks
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the item color and season rank tables from ItemColor and SeasonColor"
+    )
+
+    def handle(self, *args, **kwargs):
+        rebuild_ranks()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {ItemColorRank.objects.count()} color ranks and "
+                f"{ItemSeasonRank.objects.count()} season ranks."
+            )
+        )
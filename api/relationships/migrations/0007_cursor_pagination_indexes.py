@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('color', '0003_alter_color_id'),
+        ('items', '0008_cursor_pagination_indexes'),
+        ('relationships', '0006_alter_itemcolor_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemcolor',
+            index=models.Index(fields=['color', 'euclidean_distance', 'item'], name='itemcolor_color_distance_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_ranks(apps, schema_editor):
+    ItemColor = apps.get_model('relationships', 'ItemColor')
+    ItemColorRank = apps.get_model('relationships', 'ItemColorRank')
+    ItemSeasonRank = apps.get_model('relationships', 'ItemSeasonRank')
+
+    best_colors = ItemColor.objects.order_by(
+        'item_id', 'color_id', 'euclidean_distance', 'id'
+    ).distinct('item_id', 'color_id')
+    ItemColorRank.objects.bulk_create(
+        ItemColorRank(
+            item_id=ic.item_id,
+            color_id=ic.color_id,
+            item_color_id=ic.id,
+            euclidean_distance=ic.euclidean_distance,
+        )
+        for ic in best_colors.iterator()
+    )
+
+    best_seasons = (
+        ItemColor.objects.annotate(rank_season_id=F('color__color_seasons__season_id'))
+        .filter(rank_season_id__isnull=False)
+        .order_by('item_id', 'rank_season_id', 'euclidean_distance', 'id')
+        .distinct('item_id', 'rank_season_id')
+    )
+    ItemSeasonRank.objects.bulk_create(
+        ItemSeasonRank(
+            item_id=ic.item_id,
+            season_id=ic.rank_season_id,
+            item_color_id=ic.id,
+            euclidean_distance=ic.euclidean_distance,
+        )
+        for ic in best_seasons.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('color', '0003_alter_color_id'),
+        ('items', '0008_cursor_pagination_indexes'),
+        ('relationships', '0007_cursor_pagination_indexes'),
+        ('season', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemColorRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('euclidean_distance', models.FloatField()),
+                ('color', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_ranks', to='color.color')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='color_ranks', to='items.item')),
+                ('item_color', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='relationships.itemcolor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['color', 'euclidean_distance', 'item'], name='itemcolorrank_distance_idx')],
+                'unique_together': {('item', 'color')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemSeasonRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('euclidean_distance', models.FloatField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_ranks', to='items.item')),
+                ('item_color', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='relationships.itemcolor')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_ranks', to='season.season')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['season', 'euclidean_distance', 'item'], name='itemseasonrank_distance_idx')],
+                'unique_together': {('item', 'season')},
+            },
+        ),
+        migrations.RunPython(populate_ranks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('color', '0003_alter_color_id'),
+        ('items', '0009_filter_indexes'),
+        ('relationships', '0008_item_ranks'),
+        ('season', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemcolor',
+            index=models.Index(fields=['item', 'color', 'euclidean_distance'], name='itemcolor_item_distance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seasoncolor',
+            index=models.Index(fields=['color', 'season'], name='seasoncolor_color_idx'),
+        ),
+    ]
@@ -21,6 +21,17 @@ class ItemColor(models.Model):
 
     class Meta:
         unique_together = ("item", "real_rgb", "color")
+        indexes = [
+            models.Index(
+                fields=["color", "euclidean_distance", "item"],
+                name="itemcolor_color_distance_idx",
+            ),
+            # Closest colors of an item (prefetches and api.relationships.ranks)
+            models.Index(
+                fields=["item", "color", "euclidean_distance"],
+                name="itemcolor_item_distance_idx",
+            ),
+        ]
 
 
 class SeasonColor(models.Model):
@@ -35,3 +46,65 @@ class SeasonColor(models.Model):
 
     class Meta:
         unique_together = ("season", "color")
+        # The unique constraint covers season -> colors, this the reverse walk
+        indexes = [
+            models.Index(fields=["color", "season"], name="seasoncolor_color_idx"),
+        ]
+
+
+class ItemColorRank(models.Model):
+    """Closest ItemColor of each item for each of its colors.
+
+    Denormalized from ItemColor and kept up to date by api.relationships.ranks,
+    so that items can be filtered and sorted by color from an index instead of
+    aggregating their colors on every request.
+    """
+
+    item = models.ForeignKey(
+        "items.Item", on_delete=models.CASCADE, related_name="color_ranks"
+    )
+    color = models.ForeignKey(
+        Color, on_delete=models.CASCADE, related_name="item_ranks"
+    )
+    item_color = models.ForeignKey(
+        ItemColor, on_delete=models.CASCADE, related_name="+"
+    )
+    euclidean_distance = models.FloatField()
+
+    class Meta:
+        unique_together = ("item", "color")
+        indexes = [
+            models.Index(
+                fields=["color", "euclidean_distance", "item"],
+                name="itemcolorrank_distance_idx",
+            ),
+        ]
+
+
+class ItemSeasonRank(models.Model):
+    """Closest ItemColor of each item among the colors of each season.
+
+    Denormalized from ItemColor and SeasonColor and kept up to date by
+    api.relationships.ranks, so that items can be filtered and sorted by
+    season without joining through the season's colors.
+    """
+
+    item = models.ForeignKey(
+        "items.Item", on_delete=models.CASCADE, related_name="season_ranks"
+    )
+    season = models.ForeignKey(
+        Season, on_delete=models.CASCADE, related_name="item_ranks"
+    )
+    item_color = models.ForeignKey(
+        ItemColor, on_delete=models.CASCADE, related_name="+"
+    )
+    euclidean_distance = models.FloatField()
+
+    class Meta:
+        unique_together = ("item", "season")
+        indexes = [
+            models.Index(
+                fields=["season", "euclidean_distance", "item"],
+                name="itemseasonrank_distance_idx",
+            ),
+        ]
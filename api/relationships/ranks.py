@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models import F
+from api.items.models import Item
+from .models import ItemColor, ItemColorRank, ItemSeasonRank
+
+
+def best_item_colors(item_colors, *group_by):
+    """Returns the closest ItemColor (lowest euclidean_distance, then lowest id)
+    of each group of item_colors, using PostgreSQL's DISTINCT ON."""
+    return item_colors.order_by(*group_by, "euclidean_distance", "id").distinct(
+        *group_by
+    )
+
+
+def color_ranks(item_colors):
+    """Builds (unsaved) ItemColorRank rows for the items of item_colors."""
+    return [
+        ItemColorRank(
+            item_id=item_color.item_id,
+            color_id=item_color.color_id,
+            item_color=item_color,
+            euclidean_distance=item_color.euclidean_distance,
+        )
+        for item_color in best_item_colors(item_colors, "item_id", "color_id")
+    ]
+
+
+def season_ranks(item_colors):
+    """Builds (unsaved) ItemSeasonRank rows for the items of item_colors, from
+    the seasons their colors belong to."""
+    item_colors = item_colors.annotate(
+        rank_season_id=F("color__color_seasons__season_id")
+    ).filter(rank_season_id__isnull=False)
+
+    return [
+        ItemSeasonRank(
+            item_id=item_color.item_id,
+            season_id=item_color.rank_season_id,
+            item_color=item_color,
+            euclidean_distance=item_color.euclidean_distance,
+        )
+        for item_color in best_item_colors(item_colors, "item_id", "rank_season_id")
+    ]
+
+
+def lock_items(item_ids):
+    """Locks the rows of the given items until the end of the transaction, so
+    that concurrent refreshes of their ranks don't insert the same rows twice.
+    NO KEY UPDATE doesn't conflict with the locks taken by inserts of ItemColor
+    rows referencing the items, and the id order avoids deadlocks."""
+    list(
+        Item.objects.select_for_update(no_key=True)
+        .filter(id__in=item_ids)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+@transaction.atomic
+def refresh_item_ranks(item_ids):
+    """Recomputes the color and season ranks of the given items, after their
+    ItemColor rows changed."""
+    lock_items(item_ids)
+    item_colors = ItemColor.objects.filter(item_id__in=item_ids)
+
+    ItemColorRank.objects.filter(item_id__in=item_ids).delete()
+    ItemColorRank.objects.bulk_create(color_ranks(item_colors))
+
+    ItemSeasonRank.objects.filter(item_id__in=item_ids).delete()
+    ItemSeasonRank.objects.bulk_create(season_ranks(item_colors))
+
+
+@transaction.atomic
+def refresh_season_ranks(season_id, color_id):
+    """Recomputes the ranks in a season of the items having a color, after
+    the color was added to or removed from the season."""
+    item_ids = ItemColor.objects.filter(color_id=color_id).values("item_id")
+    lock_items(item_ids)
+    item_colors = ItemColor.objects.filter(
+        item_id__in=item_ids, color__color_seasons__season_id=season_id
+    )
+
+    ItemSeasonRank.objects.filter(season_id=season_id, item_id__in=item_ids).delete()
+    ItemSeasonRank.objects.bulk_create(
+        [
+            ItemSeasonRank(
+                item_id=item_color.item_id,
+                season_id=season_id,
+                item_color=item_color,
+                euclidean_distance=item_color.euclidean_distance,
+            )
+            for item_color in best_item_colors(item_colors, "item_id")
+        ]
+    )
+
+
+@transaction.atomic
+def rebuild_ranks():
+    """Recomputes all color and season ranks from scratch."""
+    ItemColorRank.objects.all().delete()
+    ItemColorRank.objects.bulk_create(color_ranks(ItemColor.objects.all()))
+
+    ItemSeasonRank.objects.all().delete()
+    ItemSeasonRank.objects.bulk_create(season_ranks(ItemColor.objects.all()))
@@ -0,0 +1,82 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import ItemColor, SeasonColor
+from .ranks import refresh_item_ranks, refresh_season_ranks
+
+# Keep ItemColorRank and ItemSeasonRank in sync with the rows they are derived
+# from. Bulk operations (QuerySet.update, bulk_create) don't send these signals:
+# callers refresh the ranks themselves.
+
+
+@receiver(pre_save, sender=ItemColor, dispatch_uid="item_color_pre_save")
+def remember_item_color_item(sender, instance, **kwargs):
+    # An updated ItemColor may move to another item, whose ranks need a refresh too
+    instance._previous_item_id = None
+    if instance.pk is not None:
+        instance._previous_item_id = (
+            ItemColor.objects.filter(pk=instance.pk)
+            .values_list("item_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=ItemColor, dispatch_uid="item_color_post_save")
+def item_color_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    item_ids = {instance.item_id, getattr(instance, "_previous_item_id", None)}
+    refresh_item_ranks([item_id for item_id in item_ids if item_id is not None])
+
+
+@receiver(pre_delete, sender=ItemColor, dispatch_uid="item_color_pre_delete")
+def remember_deleted_item_color(sender, instance, origin=None, **kwargs):
+    # Deleting an Item or a Color cascades to many ItemColor rows: the deletion
+    # sends pre_delete for all of them before deleting any, so their items are
+    # collected on the origin of the deletion and refreshed once, after the
+    # last one is deleted
+    if origin is None:
+        return
+    if not hasattr(origin, "_pending_item_colors"):
+        origin._pending_item_colors = set()
+        origin._pending_item_ids = set()
+    origin._pending_item_colors.add(instance.pk)
+    origin._pending_item_ids.add(instance.item_id)
+
+
+@receiver(post_delete, sender=ItemColor, dispatch_uid="item_color_post_delete")
+def item_color_deleted(sender, instance, origin=None, **kwargs):
+    pending = getattr(origin, "_pending_item_colors", None)
+    if pending is None:
+        refresh_item_ranks([instance.item_id])
+        return
+
+    pending.discard(instance.pk)
+    if not pending:
+        refresh_item_ranks(origin._pending_item_ids)
+        del origin._pending_item_colors, origin._pending_item_ids
+
+
+@receiver(pre_save, sender=SeasonColor, dispatch_uid="season_color_pre_save")
+def remember_season_color(sender, instance, **kwargs):
+    instance._previous_season_color = None
+    if instance.pk is not None:
+        instance._previous_season_color = (
+            SeasonColor.objects.filter(pk=instance.pk)
+            .values_list("season_id", "color_id")
+            .first()
+        )
+
+
+@receiver(post_save, sender=SeasonColor, dispatch_uid="season_color_post_save")
+def season_color_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_season_color", None)
+    if previous is not None and previous != (instance.season_id, instance.color_id):
+        refresh_season_ranks(*previous)
+    refresh_season_ranks(instance.season_id, instance.color_id)
+
+
+@receiver(post_delete, sender=SeasonColor, dispatch_uid="season_color_post_delete")
+def season_color_deleted(sender, instance, **kwargs):
+    refresh_season_ranks(instance.season_id, instance.color_id)
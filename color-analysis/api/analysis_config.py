@@ -0,0 +1,36 @@
+# analysis_config.py
+import hashlib
+import json
+import os
+from models import config
+
+# Configuration of the analysis run by the workers (see tasks.py). It is also read by the API,
+# since it is part of the keys of the result cache (see result_cache.py): results computed with
+# another configuration are never served. The API and the workers must share these settings.
+segmentation_model = os.environ.get("SEGMENTATION_MODEL", "cloud")  # should be in ['local', 'cloud', 'int8', 'local_int8']
+dominants_method = os.environ.get("DOMINANTS_METHOD", "kmeans")  # should be in ['kmeans', 'histogram']
+# backend running the segmentation model on cpu, see models/inference_backends.py
+segmentation_backend = os.environ.get("SEGMENTATION_BACKEND", config.SEGMENTATION_BACKEND)  # should be in ['eager', 'torchscript']
+# cropping of the image to the user's head before segmentation, falling back to the full image if no face is found;
+# disabled by default, since it changes the results of the analysis. The crop runs on the upload decoded with its
+# longest side of (at least) face_crop_decode_size pixels, and is then downscaled as uncropped images are, so that
+# the face is analyzed at a higher resolution
+face_crop = os.environ.get("FACE_CROP", "0") == "1"
+face_crop_decode_size = int(os.environ.get("FACE_CROP_DECODE_SIZE", "1200"))
+# version of the analysis: to be bumped whenever a change of its code or of the model weights changes its results
+analysis_version = "1"
+
+
+def fingerprint() -> str:
+    """
+    Returns a short hex digest identifying the configuration of the analysis.
+    """
+    settings = {
+        "segmentation_model": segmentation_model,
+        "dominants_method": dominants_method,
+        "segmentation_backend": segmentation_backend,
+        "face_crop": face_crop,
+        "face_crop_decode_size": face_crop_decode_size if face_crop else None,
+        "analysis_version": analysis_version,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
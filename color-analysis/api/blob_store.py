@@ -0,0 +1,108 @@
+# blob_store.py
+import mmap
+import os
+import time
+import uuid
+import redis
+
+blob_store_backend = os.environ.get("BLOB_STORE", "redis")  # should be in ['redis', 'file']
+blob_store_url = os.environ.get("BLOB_STORE_URL", os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0"))
+blob_store_path = os.environ.get("BLOB_STORE_PATH", "/dev/shm/color-analysis-uploads")
+blob_ttl = int(os.environ.get("BLOB_TTL", "600"))  # seconds
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+class RedisBlobStore:
+    """
+    Blob store keeping uploads as Redis keys which expire after ttl seconds, so that
+    blobs of tasks which are never executed don't pile up.
+    """
+
+    def __init__(self, client, ttl=blob_ttl, prefix="blob"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def put(self, contents: bytes) -> str:
+        ref = f"{self.prefix}:{uuid.uuid4().hex}"
+        self.client.set(ref, contents, ex=self.ttl)
+        return ref
+
+    def open(self, ref: str):
+        """
+        Returns the blob referenced by ref as a bytes object.
+        """
+        contents = self.client.get(ref)
+        if contents is None:
+            raise BlobNotFound(ref)
+        return contents
+
+    def delete(self, ref: str) -> None:
+        self.client.delete(ref)
+
+
+class FileBlobStore:
+    """
+    Blob store keeping uploads as files of a directory shared by the API and the workers,
+    ideally on a tmpfs (e.g. /dev/shm) so that blobs never touch disk. Blobs are read back
+    through memory mapping. Files older than ttl seconds are swept at most once per ttl.
+    """
+
+    def __init__(self, directory=blob_store_path, ttl=blob_ttl):
+        self.directory = directory
+        self.ttl = ttl
+        self.last_sweep_ = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def path_(self, ref: str) -> str:
+        assert ref.startswith("file:")
+        return os.path.join(self.directory, os.path.basename(ref[len("file:"):]))
+
+    def put(self, contents: bytes) -> str:
+        self.sweep_()
+
+        ref = f"file:{uuid.uuid4().hex}"
+        path = self.path_(ref)
+        # written under a temporary name and moved in place, so that workers never see partial blobs
+        with open(path + ".tmp", "wb") as blob_file:
+            blob_file.write(contents)
+        os.replace(path + ".tmp", path)
+        return ref
+
+    def open(self, ref: str):
+        """
+        Returns the blob referenced by ref as a read-only memory map, which can be used as a file object.
+        """
+        try:
+            with open(self.path_(ref), "rb") as blob_file:
+                return mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):  # ValueError: empty file, which can't be mapped
+            raise BlobNotFound(ref)
+
+    def delete(self, ref: str) -> None:
+        try:
+            os.remove(self.path_(ref))
+        except FileNotFoundError:
+            pass
+
+    def sweep_(self) -> None:
+        now = time.time()
+        if now - self.last_sweep_ < self.ttl:
+            return
+
+        self.last_sweep_ = now
+        for entry in os.scandir(self.directory):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+if blob_store_backend == "file":
+    blob_store = FileBlobStore()
+else:
+    blob_store = RedisBlobStore(redis.Redis.from_url(blob_store_url))
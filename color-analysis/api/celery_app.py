@@ -5,6 +5,6 @@ from celery import Celery
 broker_url = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
 result_backend = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 
-celery_app = Celery("worker", broker=broker_url, backend=result_backend)
-
-import tasks
+# tasks are only imported by workers (through include), so that clients such as the API
+# can send tasks by name without importing the models they depend on
+celery_app = Celery("worker", broker=broker_url, backend=result_backend, include=["tasks"])
@@ -0,0 +1,39 @@
+# image_loading.py
+# Decoding and resizing of uploaded images, shared by the API and the Celery workers:
+# it only depends on PIL, so that the API process doesn't import any ML library.
+import io
+from PIL import Image
+
+
+def target_size_(width: int, height: int, max_size: int = 300) -> tuple:
+    if width > height:
+        return max_size, int((height / width) * max_size)
+    return int((width / height) * max_size), max_size
+
+
+def resize_image(image: Image.Image, max_size: int = 300) -> Image.Image:
+    """
+    Resizes image so that its longest side is max_size pixels, keeping its aspect ratio.
+    """
+    return image.resize(target_size_(*image.size, max_size), Image.NEAREST)
+
+
+def open_image(file_contents, max_size: int = 300) -> Image.Image:
+    """
+    Decodes the raw file bytes (or a file object, e.g. a memory-mapped blob) into an
+    RGB image. JPEG files are decoded in draft mode, which lets the decoder scale the
+    image down by 1/2, 1/4 or 1/8 while decoding, picking the smallest scale that still
+    covers the target size of resize_image; other formats (and JPEGs the draft mode
+    can't handle) are fully decoded.
+    """
+    if isinstance(file_contents, (bytes, bytearray)):
+        file_contents = io.BytesIO(file_contents)
+    image = Image.open(file_contents)
+
+    if image.format == "JPEG":
+        try:
+            image.draft("RGB", target_size_(*image.size, max_size))
+        except Exception as e:
+            print("Draft decoding unavailable, decoding full image: " + str(e))
+
+    return image.convert("RGB")
@@ -1,58 +1,30 @@
 # main.py
 import io
+import json
+import asyncio
+import redis.asyncio
 from fastapi import FastAPI, UploadFile
-from fastapi.responses import HTMLResponse
-from celery.result import AsyncResult
-from tasks import process_image_task  # Import our Celery task
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import torch
-import cv2
-from PIL import Image
-from pipeline import pipeline, segmentation_filter, user_palette_classification_filter, retrieval_filter
-import torch.backends
-from metrics_and_losses import metrics
-from utils import segmentation_labels, utils
-import matplotlib.pyplot as plt
-from palette_classification import color_processing, palette
-import glob
-import json
-import io
-import time
-import math
-from collections import OrderedDict
-
-device = 'mps:0' if torch.backends.mps.is_available() else 'cpu'
-verbose = False
-segmentation_model = 'cloud' # should be in ['local', 'cloud']
-query = 'dress' # should be in ['dress', 'upper_body', 'lower_body']
-n_plotted_retrieved_clothes = 50
-print("Using device " + device)
-
-# setting paths
-palettes_path = 'palette_classification/palettes/'
-cloth_dataset_path = 'dresscode_test_dataset/'
-palette_mappings_path = 'palette_classification/clothing_palette_mappings/'
-
-# loading reference palettes for user palette classification filter
-palette_filenames = glob.glob(palettes_path + '*.csv')
-reference_palettes = [palette.PaletteRGB().load(
-    palette_filename.replace('\\', '/'), header=True) for palette_filename in palette_filenames]
-
-# loading palette mappings for retrieval filter
-palette_mappings_dict = {}
-for category in ['dresses', 'lower_body', 'upper_body']:
-    mapping_dict_filename = palette_mappings_path + category + '/' + category + '_palette_mappings.json'
-    with open(mapping_dict_filename) as mapping_dict_file:
-        palette_mappings_dict[category] = json.load(mapping_dict_file)
-
-# instantiating pipeline
-pl = pipeline.Pipeline()
-
-sf = segmentation_filter.SegmentationFilter(segmentation_model)
-pl.add_filter(sf)
+from celery_app import celery_app
+from image_loading import open_image, resize_image
+from result_cache import result_cache, image_hash
+from blob_store import blob_store
+from result_notifier import ResultNotifier, task_response, notifier_url
+from task_metrics import task_metrics
+
+# The API process only hands requests off to the Celery workers, which load the models:
+# no ML library nor model is imported here, so that the API starts fast and stays small.
 
 app = FastAPI()
 
+# push-based delivery of results, see endpoints /result/{task_id}/wait and /result/{task_id}/events
+result_notifier = ResultNotifier(redis.asyncio.Redis.from_url(notifier_url))
+max_wait_timeout = 60.0  # seconds
+keep_alive_interval = 15.0  # seconds
+max_stream_duration = 600.0  # seconds
+
 # Enable CORS for localhost:3000
 app.add_middleware(
     CORSMiddleware,
@@ -63,41 +35,144 @@ app.add_middleware(
 )
 
 
+def submit_upload_(contents: bytes) -> dict:
+    """
+    Answers an upload from the result cache, or submits its processing task to Celery.
+    Decoding, hashing, Redis and broker calls are all blocking: it is run in a thread
+    pool, so that it doesn't block the event loop.
+    """
+    # re-uploads of an already analyzed image are answered from the result cache
+    try:
+        image_key = image_hash(resize_image(open_image(contents)))
+    except Exception:
+        image_key = None  # let the task report the error
+
+    if image_key is not None:
+        cached_result = result_cache.get(image_key)
+        if cached_result is not None:
+            print("Result cache hit:", image_key)
+            return {"task_id": None, "state": "SUCCESS", "result": cached_result}
+
+    # only a reference to the upload goes through the broker, the bytes go to the blob store
+    image_ref = blob_store.put(contents)
+    print("Submitting task with file size:", len(contents))
+    task = celery_app.send_task("tasks.process_image_task", args=(image_ref, image_key))
+    print("Task submitted:", task.id)
+    return {"task_id": task.id}
+
+
 @app.post("/uploadfile/")
 async def create_upload_file(file: UploadFile):
     """
     Endpoint to accept file uploads. It submits the image processing task to Celery
-    and returns the task ID.
+    and returns the task ID. If the same image has already been analyzed, the cached
+    analysis is returned right away, with no task ID.
     """
     contents = await file.read()
-    print("Submitting task with file size:", len(contents))
-    task = process_image_task.delay(contents)
-    print("Task submitted:", task.id)
-    return {"task_id": task.id}
+    return await run_in_threadpool(submit_upload_, contents)
 
 @app.get("/result/{task_id}")
 async def get_result(task_id: str):
     """
     Endpoint to poll for task results.
     """
-    task_result = AsyncResult(task_id)
-
-    print("Task Result is: " + str(task_result))
-
-    if task_result.state == "PENDING":
-        # Task is still waiting to be executed
-        return {"state": task_result.state, "status": "Task pending..."}
-    elif task_result.state == "STARTED":
-        # Task is currently processing
-        return {"state": task_result.state, "status": "Task in progress..."}
-    elif task_result.state == "SUCCESS":
-        # Task completed successfully
-        return {"state": task_result.state, "result": task_result.result}
-    elif task_result.state == "FAILURE":
-        # Task failed
-        return {"state": task_result.state, "status": str(task_result.info)}
-    else:
-        return {"state": task_result.state, "status": "Unknown state"}
+    return await run_in_threadpool(current_task_response_, task_id)
+
+
+def current_task_response_(task_id: str) -> dict:
+    """
+    Returns the current response of the task, with its result only once it is completed.
+    It queries the result backend synchronously, so it is run in a thread pool.
+    """
+    task_result = celery_app.AsyncResult(task_id)
+    state = task_result.state
+    if state in ("SUCCESS", "FAILURE"):
+        return task_response(state, task_result.result if state == "SUCCESS" else task_result.info)
+    return task_response(state, None)
+
+
+def completed_task_response_(task_id: str):
+    """
+    Returns the response of the task if it is already completed, None otherwise.
+    It queries the result backend synchronously, so it is run in a thread pool.
+    """
+    task_result = celery_app.AsyncResult(task_id)
+    if task_result.ready():
+        return task_response(task_result.state, task_result.result if task_result.successful() else task_result.info)
+    return None
+
+
+async def wait_for_task_(task_id: str, timeout: float) -> dict:
+    """
+    Waits at most timeout seconds for the completion of the task, without polling
+    the result backend, and returns its response (its current one on timeout).
+    Calls to the result backend are run in a thread pool, so that they don't block
+    the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    future = result_notifier.subscribe(task_id)
+    try:
+        # the task is checked once the notifier is subscribed, so that a completion
+        # published in between is received
+        await result_notifier.wait_subscribed(timeout)
+        response = await run_in_threadpool(completed_task_response_, task_id)
+        if response is not None:
+            return response
+
+        return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+    except asyncio.TimeoutError:
+        # the completion may have been missed (notifier reconnecting, failed publish):
+        # the current response carries the result of a task completed meanwhile
+        return await run_in_threadpool(current_task_response_, task_id)
+    finally:
+        result_notifier.unsubscribe(task_id, future)
+
+
+@app.get("/result/{task_id}/wait")
+async def wait_result(task_id: str, timeout: float = 30.0):
+    """
+    Long-poll endpoint: holds the request until the task completes, or at most
+    timeout seconds, and returns the same response as /result/{task_id}.
+    """
+    return await wait_for_task_(task_id, min(timeout, max_wait_timeout))
+
+
+@app.get("/result/{task_id}/events")
+async def stream_result(task_id: str):
+    """
+    Server-Sent Events endpoint: keeps the connection open, sending a keep-alive
+    comment every keep_alive_interval seconds, until the task completes, then sends
+    its response as a 'result' event and closes the stream.
+    """
+    async def events():
+        for _ in range(int(max_stream_duration // keep_alive_interval)):
+            response = await wait_for_task_(task_id, keep_alive_interval)
+            if response["state"] in ("SUCCESS", "FAILURE"):
+                yield "event: result\ndata: " + json.dumps(response) + "\n\n"
+                return
+            yield ": keep-alive\n\n"
+        yield "event: timeout\ndata: " + json.dumps(response) + "\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Endpoint exposing hit and miss counts of the result cache.
+    """
+    return await run_in_threadpool(result_cache.stats)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Endpoint exposing the metrics of the analysis tasks run by the workers, in the
+    Prometheus text format, to be scraped by Prometheus.
+    """
+    metrics = await run_in_threadpool(task_metrics.render)
+    return PlainTextResponse(metrics, media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
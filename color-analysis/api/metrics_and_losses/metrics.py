@@ -6,6 +6,7 @@ sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 
 import cv2
 import torch
+import numpy as np
 import utils.utils as utils
 
 
@@ -25,6 +26,28 @@ def rmse(img1, img2):
     return (((img1_CIELab - img2_CIELab) ** 2).sum() / (H * W)) ** 0.5
 
 
+def rmse_color_reconstruction(colors_CIELab, counts, color_CIELab, n_pixels):
+    """
+    .. description::
+    Computes the RMSE between a masked image and its reconstruction obtained by replacing all non-black pixels with
+    a single color, without building the reconstruction. The masked image is described by its distinct non-black
+    colors and their pixel counts, so that its conversion in CIELab is done once and shared across reconstructions.
+    The same uint8 arithmetic of function rmse is used, so that rmse(img, reconstruction) is returned.
+
+    .. inputs::
+    colors_CIELab:  numpy array of shape (n_colors, 3) of dtype uint8, containing the distinct non-black colors of
+                    the masked image converted in CIELab by cv2.cvtColor.
+    counts:         numpy array of shape (n_colors,) containing the number of pixels of each color.
+    color_CIELab:   numpy array of shape (3,) of dtype uint8, containing the reconstruction color in CIELab.
+    n_pixels:       total number of pixels (H * W) of the masked image.
+    """
+    assert(colors_CIELab.dtype == np.uint8 and color_CIELab.dtype == np.uint8)
+
+    # black pixels are black in the reconstruction too, so only non-black ones contribute to the error
+    squared_errors = ((colors_CIELab - color_CIELab[None, :]) ** 2).astype(np.uint64).sum(axis=1)
+    return ((squared_errors * counts.astype(np.uint64)).sum() / n_pixels) ** 0.5
+
+
 def batch_mIoU(predictions, targets, weights=None):
     """
     .. description::
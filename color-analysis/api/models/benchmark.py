@@ -0,0 +1,145 @@
+# --- Needed to import modules from other packages
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+# ---
+
+import os
+import json
+import time
+import platform
+import resource
+import multiprocessing
+import numpy as np
+import torch
+from models.local.FastSCNN.models import fast_scnn
+from models.local.CGNet.model import CGNet
+from models.local.LEDNet.models import lednet
+from models.cloud.UNet import unet
+from models.cloud.Deeplabv3 import deeplabv3
+from utils import segmentation_labels, utils
+
+
+def build_model(model_name, n_classes, input_size):
+    """
+    .. description::
+    Instantiates the face segmentation model model_name (a key of utils.model_names.MODEL_NAMES) with randomly
+    initialized weights, as done for training: the serving cost of a model doesn't depend on its weights.
+    """
+    if model_name == "fastscnn":
+        return fast_scnn.FastSCNN(n_classes)
+    elif model_name == "cgnet":
+        return CGNet.Context_Guided_Network(classes=n_classes)
+    elif model_name == "lednet":
+        return lednet.LEDNet(num_classes=n_classes, output_size=input_size)
+    elif model_name == "unet":
+        return unet.UNet(out_channels=n_classes)
+    elif model_name == "deeplab":
+        # no pretrained backbone, which would be downloaded
+        return deeplabv3.deeplabv3_resnet50(num_classes=n_classes, weights_backbone=None)
+
+    raise Exception("model not supported.")
+
+
+def peak_rss_mb_():
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    scale = 2 ** 20 if platform.system() == 'Darwin' else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def benchmark_configuration_(model_name, resolution, batch_size, n_runs, n_warmup, n_threads):
+    """
+    .. description::
+    Benchmarks model_name on cpu on random inputs of shape (batch_size, 3, resolution, resolution). Meant to be
+    run in a dedicated process, so that peak RSS only accounts for said configuration.
+
+    .. outputs::
+    Returns a dictionary with latency percentiles (ms per batch), throughput (images per second), peak RSS of the
+    process before building the model and at the end of the benchmark (MB) and number of parameters.
+    """
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+
+    baseline_rss_mb = peak_rss_mb_()
+    input_size = (resolution, resolution)
+    model = build_model(model_name, len(segmentation_labels.labels), input_size).eval()
+    input = torch.rand((batch_size, 3, *input_size))
+    latencies = []
+
+    with torch.inference_mode():
+        for _ in range(n_warmup):
+            model(input)
+
+        for _ in range(n_runs):
+            clock_start = time.perf_counter()
+            model(input)
+            latencies.append(1000 * (time.perf_counter() - clock_start))
+
+    latencies = np.array(latencies)
+    return {
+        'model_name': model_name,
+        'resolution': resolution,
+        'batch_size': batch_size,
+        'n_parameters': utils.count_learnable_parameters(model),
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        'latency_ms_mean': float(latencies.mean()),
+        'throughput_images_per_s': float(1000 * batch_size / latencies.mean()),
+        'baseline_rss_mb': baseline_rss_mb,
+        'peak_rss_mb': peak_rss_mb_(),
+        'n_threads': torch.get_num_threads(),
+    }
+
+
+def main_worker(args):
+    # a fresh process for each configuration, so that peak RSS isn't inflated by previous configurations
+    context = multiprocessing.get_context('spawn')
+    results = []
+
+    print(f"{'model':>9} {'res':>5} {'batch':>5} {'params':>10} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>8} {'RSS MB':>7}")
+
+    for model_name in args.model_names:
+        for resolution in args.resolutions:
+            for batch_size in args.batch_sizes:
+                with context.Pool(1) as pool:
+                    try:
+                        result = pool.apply(benchmark_configuration_, (
+                            model_name, resolution, batch_size, args.n_runs, args.n_warmup, args.n_threads))
+                    except Exception as e:
+                        # e.g. architectures requiring input sizes divisible by some factor
+                        print(f"{model_name:>9} {resolution:>5} {batch_size:>5} failed: {e}")
+                        results.append({ 'model_name': model_name, 'resolution': resolution,
+                                         'batch_size': batch_size, 'error': str(e) })
+                        continue
+
+                results.append(result)
+                print(f"{model_name:>9} {resolution:>5} {batch_size:>5} {result['n_parameters']:>10} "
+                      f"{result['latency_ms_p50']:>9.1f} {result['latency_ms_p95']:>9.1f} "
+                      f"{result['throughput_images_per_s']:>8.2f} {result['peak_rss_mb']:>7.0f}")
+
+    report = {
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+        },
+        'settings': {
+            'n_runs': args.n_runs,
+            'n_warmup': args.n_warmup,
+            'n_threads': args.n_threads,
+        },
+        'results': results,
+    }
+
+    os.makedirs(path.dirname(path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+    print(f"Report saved to {args.output}.")
+
+
+if __name__ == '__main__':
+    args = utils.parse_models_benchmark_arguments()
+    main_worker(args)
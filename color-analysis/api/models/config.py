@@ -20,3 +20,9 @@ NORMALIZE_STD = [0.2513, 0.2356, 0.2309]
 
 # Weights assigned to each class in the dataset, representing their importance.
 CLASS_WEIGHTS = [0.3762, 0.9946, 0.9974, 0.9855, 0.7569, 0.9140, 0.9968, 0.9936, 0.9989, 0.9893, 0.9968]
+
+# Backend used by pipeline.segmentation_filter.SegmentationFilter to run face segmentation models on cpu, 
+# either 'eager' or 'torchscript' (see models/inference_backends.py), and number of threads used for intra-op
+# parallelism by backend 'torchscript' (None for PyTorch default).
+SEGMENTATION_BACKEND = 'eager'
+SEGMENTATION_N_THREADS = None
@@ -0,0 +1,109 @@
+# --- Needed to import modules from other packages
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+# ---
+
+import os
+import copy
+import tempfile
+import torch
+from torch import nn
+
+
+def export_torchscript(model, input_size, filename, channels_last=True):
+    """
+    .. description::
+    Exports model (a face segmentation model with loaded weights) as a frozen TorchScript graph and saves it to
+    filename. The model is traced on a random input of shape (1, 3, input_size[0], input_size[1]), then frozen,
+    which inlines weights as constants and folds each batch normalization into the preceding convolution.
+    The graph is written to a temporary file of the same directory, then moved to filename, so that processes
+    exporting it concurrently (e.g. the prefork pool processes of a worker, see load_torchscript_backend) never
+    read a partially written file. Returns the exported graph.
+
+    .. inputs::
+    channels_last: if True, the model is exported for inputs in channels-last memory format.
+    """
+
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+
+    # exporting a copy, since changing device and memory format of a module is done in place
+    model = copy.deepcopy(model).to('cpu').eval()
+    example_input = torch.rand((1, 3, *input_size))
+
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example_input = example_input.to(memory_format=torch.channels_last)
+
+    with torch.no_grad():
+        traced_model = torch.jit.trace(model, example_input)
+        frozen_model = torch.jit.freeze(traced_model)
+
+    file_descriptor, temp_filename = tempfile.mkstemp(dir=path.dirname(path.abspath(filename)), suffix='.tmp')
+    os.close(file_descriptor)
+    try:
+        torch.jit.save(frozen_model, temp_filename)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
+
+    return frozen_model
+
+
+class TorchScriptBackend:
+    """
+    .. description::
+    Cpu runtime for face segmentation models exported by function export_torchscript. When loaded, the graph is
+    further optimized for inference on the current machine (e.g. fusing convolutions with following activations
+    and converting them to MKLDNN where profitable); since such optimizations can't be serialized, they are not
+    part of the exported graph. Since they don't support every operator (e.g. MKLDNN adaptive average pooling
+    requires output sizes dividing input sizes, which is not the case in the pyramid pooling of FastSCNN), the
+    optimized graph is checked on a random input of shape (1, 3, input_size[0], input_size[1]), falling back to
+    the frozen graph if it fails. Inputs are converted to
+    channels-last memory format (if the model was exported for it) and the model is run in inference mode,
+    which disables autograd tracking entirely. If n_threads is not None, the number of threads used for
+    intra-op parallelism is set to n_threads (which affects the whole process); by default, PyTorch uses as many
+    threads as physical cores, which is usually best when a single inference runs at a time, while fewer threads
+    per process are preferable when several worker processes share the cores.
+    The backend is called as the eager model would be, returning a tuple whose first element is the output.
+    """
+
+    def __init__(self, filename, input_size, channels_last=True, n_threads=None):
+        self.model = torch.jit.load(filename, map_location='cpu')
+        self.channels_last = channels_last
+
+        if n_threads is not None:
+            torch.set_num_threads(n_threads)
+
+        try:
+            self.model = torch.jit.optimize_for_inference(self.model)
+            self(torch.rand((1, 3, *input_size)))
+        except RuntimeError:
+            # optimizations are applied in place, so the frozen graph is loaded again
+            self.model = torch.jit.load(filename, map_location='cpu')
+
+    def __call__(self, input):
+        if self.channels_last:
+            input = input.contiguous(memory_format=torch.channels_last)
+
+        with torch.inference_mode():
+            return self.model(input)
+
+
+def load_torchscript_backend(model, weights_filename, input_size, channels_last=True, n_threads=None):
+    """
+    .. description::
+    Returns a TorchScriptBackend for the model whose weights are stored in weights_filename. The TorchScript
+    graph is stored next to the weights, with extension .torchscript.pt; it is (re-)exported from model,
+    expected to have said weights loaded, if it doesn't exist or if it is older than the weights.
+    """
+
+    torchscript_filename = os.path.splitext(weights_filename)[0] + '.torchscript.pt'
+
+    if not os.path.isfile(torchscript_filename) or \
+       os.path.getmtime(torchscript_filename) < os.path.getmtime(weights_filename):
+        export_torchscript(model, input_size, torchscript_filename, channels_last)
+
+    return TorchScriptBackend(torchscript_filename, input_size, channels_last, n_threads)
@@ -134,8 +134,9 @@ class PyramidPooling(nn.Module):
         self.out = _ConvBNReLU(in_channels * 2, out_channels, 1)
 
     def pool(self, x, size):
-        avgpool = nn.AdaptiveAvgPool2d(size)
-        return avgpool(x)
+        #avgpool = nn.AdaptiveAvgPool2d(size) # original
+        #return avgpool(x) # original
+        return F.adaptive_avg_pool2d(x, size) # modified, equivalent but traceable by torch.fx (for quantization)
 
     def upsample(self, x, size):
         return F.interpolate(x, size, mode='bilinear', align_corners=True)
@@ -0,0 +1,65 @@
+# --- Needed to import modules from other packages
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+# ---
+
+import copy
+import torch
+from torch import nn
+from torch.ao.quantization import QConfig, default_weight_observer, get_default_qconfig, quantize_fx
+
+
+def quantize_static(model, calibration_loader, n_calibration_batches=None, backend='fbgemm'):
+    """
+    .. description::
+    Static post-training int8 quantization of model (a face segmentation model with loaded weights), through
+    FX graph mode quantization: observers are inserted after each quantizable operation, calibration images are
+    passed through the model to collect activation ranges, and finally operations are replaced by their int8
+    counterparts, with weights quantized per channel (per tensor for transposed convolutions, which don't support
+    per channel quantization). The model is left unchanged. Returns the quantized model, which only runs on cpu.
+
+    .. inputs::
+    calibration_loader:     DataLoader returning (inputs, targets) batches, e.g. from a models.dataset.CcncsaDataset
+                            with the inference transforms of the model; targets are ignored.
+    n_calibration_batches:  number of batches of calibration_loader used for calibration (all if None).
+    backend:                quantized engine, 'fbgemm' for x86 cpus or 'qnnpack' for arm cpus.
+    """
+
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+
+    torch.backends.quantized.engine = backend
+    model = copy.deepcopy(model).to('cpu').eval()
+    qconfig = get_default_qconfig(backend)
+    # dictionary form of the qconfig mapping, supported by all versions of torch with example_inputs
+    qconfig_dict = {
+        '': qconfig,
+        'object_type': [(nn.ConvTranspose2d, QConfig(activation=qconfig.activation, weight=default_weight_observer))],
+    }
+    example_inputs = (next(iter(calibration_loader))[0],)
+    prepared_model = quantize_fx.prepare_fx(model, qconfig_dict, example_inputs)
+
+    with torch.no_grad():
+        for batch_idx, (batch_inputs, _) in enumerate(calibration_loader):
+            if n_calibration_batches is not None and batch_idx >= n_calibration_batches:
+                break
+            prepared_model(batch_inputs)
+
+    return quantize_fx.convert_fx(prepared_model)
+
+
+def save_quantized(quantized_model, input_size, filename):
+    """
+    .. description::
+    Saves quantized_model, as returned by function quantize_static, as a frozen TorchScript graph traced on
+    inputs of shape (1, 3, input_size[0], input_size[1]), which can be loaded without the model's code
+    (see models.inference_backends.TorchScriptBackend). Returns the saved graph.
+    """
+
+    with torch.no_grad():
+        traced_model = torch.jit.trace(quantized_model, torch.rand((1, 3, *input_size)))
+        frozen_model = torch.jit.freeze(traced_model)
+
+    torch.jit.save(frozen_model, filename)
+    return frozen_model
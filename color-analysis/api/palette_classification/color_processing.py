@@ -8,10 +8,8 @@ import numpy as np
 import torch
 import utils.utils as utils
 import cv2
-from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 from sklearn.utils import shuffle
-import warnings
 from skimage import color
 
 def color_distance(color1_RGB, color2_RGB):
@@ -66,6 +64,31 @@ def compute_segmentation_masks(img_segmented, labels):
 
     return masks
 
+def compute_segmentation_masks_from_label_map(label_map, label_indexes):
+    """
+    .. description::
+    Given a label map (uint8 pytorch tensor of shape (H, W) assigning to each pixel the index of its label, as 
+    returned by a segmentation filter with output 'labels') and a list of n_labels label indexes, returns a
+    boolean pytorch tensor of shape (n_labels, H, W) containing the segmentation masks of said labels.
+    """
+    assert(len(label_map.shape) == 2)
+
+    label_indexes = torch.tensor(label_indexes, dtype=label_map.dtype)
+    return label_map.unsqueeze(axis=0) == label_indexes.reshape((-1, 1, 1))
+
+
+def apply_label_map(img, label_map, label_indexes):
+    """
+    .. description::
+    Given an image of shape (3, H, W), a label map of shape (H, W) and a list of n_labels label indexes, returns 
+    the image masked with the segmentation mask of each label, as a pytorch tensor of shape (n_labels, 3, H, W).
+    Equivalent to applying function apply_masks to the masks of said labels, without building masks for all labels.
+    """
+    assert(img.shape[1:] == label_map.shape)
+
+    return apply_masks(img, compute_segmentation_masks_from_label_map(label_map, label_indexes))
+
+
 def erode_segmentation_mask(segmentation_mask, kernel_size):
     """
     .. description::
@@ -121,6 +144,227 @@ def apply_masks(img, masks):
     img_masked = img * masks.unsqueeze(axis=1)
     return img_masked.to(torch.uint8)
 
+def masked_colors_(img_masked):
+    """
+    .. description::
+    Given a masked image img_masked (pytorch tensor of shape (3, H, W)), returns a tuple (colors, counts) of numpy
+    arrays, where colors (shape (n_colors, 3)) contains the distinct colors of the image and counts (shape
+    (n_colors,)) the number of pixels having each color. Non-black pixels (the ones inside the mask) are deduplicated,
+    while all black pixels (the background) are collapsed into a single black color, which is the last one if present.
+    """
+    _, H, W = img_masked.shape
+    pixels = utils.from_DHW_to_HWD(img_masked).reshape((H * W, 3)).numpy().astype(np.int32)
+    packed_pixels = (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+    packed_pixels = packed_pixels[packed_pixels != 0]
+
+    packed_colors, counts = np.unique(packed_pixels, return_counts=True)
+    colors = np.stack([(packed_colors >> 16) & 255, (packed_colors >> 8) & 255, packed_colors & 255], axis=1)
+    n_background = H * W - packed_pixels.shape[0]
+
+    if n_background > 0:
+        colors = np.concatenate([colors, np.zeros((1, 3), dtype=colors.dtype)])
+        counts = np.concatenate([counts, [n_background]])
+
+    return colors, counts
+
+
+def weighted_kmeans_batch_(points, weights, n_clusters, n_init=10, max_iter=300, tol=1e-4, seed=99):
+    """
+    .. description::
+    Weighted k-means run on a batch of independent datasets at once, with k-means++ initialization and early
+    stopping. Each dataset is clustered n_init times with different initializations and the clustering with
+    lowest inertia is kept. Points with weight 0 are ignored (used to pad datasets to a common size).
+
+    .. inputs::
+    points:     numpy array of shape (batch_size, n_points, n_features).
+    weights:    numpy array of shape (batch_size, n_points).
+    n_clusters: tuple of length batch_size specifying how many clusters to find in each dataset.
+    tol:        tolerance on the squared shift of centroids to declare convergence, relative to the average
+                variance of each dataset's features (as in sklearn).
+
+    .. outputs::
+    Returns a tuple (centroids, labels), where centroids is a numpy array of shape (batch_size, max(n_clusters),
+    n_features) (rows beyond n_clusters[b] are meaningless) and labels a numpy array of shape (batch_size, n_points)
+    assigning each point to a centroid.
+    """
+    B, N, D = points.shape
+    K = max(n_clusters)
+    I = n_init
+    rng = np.random.default_rng(seed)
+
+    points = points.astype(np.float64)
+    weights = weights.astype(np.float64)
+    total_weights = weights.sum(axis=1)
+    valid_clusters = np.arange(K)[None, :] < np.array(n_clusters)[:, None]                 # (B, K)
+
+    means = (weights[:, :, None] * points).sum(axis=1) / total_weights[:, None]
+    variances = (weights[:, :, None] * (points - means[:, None, :]) ** 2).sum(axis=1) / total_weights[:, None]
+    tolerances = tol * variances.mean(axis=1)                                                # (B,)
+
+    # points are kept with the n_points axis last, which is the largest one
+    points_T = np.ascontiguousarray(points.swapaxes(1, 2))                                   # (B, D, N)
+    squared_norms = (points ** 2).sum(axis=-1)[:, None, None, :]                            # (B, 1, 1, N)
+    w = weights[:, None, :]                                                                  # (B, 1, N)
+
+    def squared_distances_(centroids):
+        # all inits share the same points, so dot products are computed with one matmul per dataset
+        dot_products = (centroids.reshape((B, I * K, D)) @ points_T).reshape((B, I, K, N))
+        d2 = squared_norms - 2 * dot_products + (centroids ** 2).sum(axis=-1)[..., None]
+        d2 = np.maximum(d2, 0)
+        d2[~np.broadcast_to(valid_clusters[:, None, :], (B, I, K))] = np.inf
+        return d2                                                                            # (B, I, K, N)
+
+    def sample_(probabilities):
+        # one weighted sample per (dataset, init); falls back to plain weights when probabilities are all zero,
+        # e.g. when a dataset has fewer distinct points than clusters
+        probabilities = np.where(probabilities.sum(axis=-1, keepdims=True) > 0, probabilities, w)
+        cumulative = probabilities.cumsum(axis=-1)
+        thresholds = rng.random((B, I, 1)) * cumulative[:, :, -1:]
+        return np.minimum((cumulative <= thresholds).sum(axis=-1), N - 1)                   # (B, I)
+
+    # k-means++ initialization
+    centroids = np.zeros((B, I, K, D))
+    closest_d2 = None
+    for c in range(K):
+        idx = sample_(np.broadcast_to(w, (B, I, N)) if closest_d2 is None else w * closest_d2)
+        centroids[:, :, c] = np.take_along_axis(points[:, None], idx[:, :, None, None], axis=2)[:, :, 0]
+        d2_c = squared_norms[:, :, 0] - 2 * (centroids[:, :, c] @ points_T) \
+            + (centroids[:, :, c] ** 2).sum(axis=-1)[..., None]
+        d2_c = np.maximum(d2_c, 0)
+        closest_d2 = d2_c if closest_d2 is None else np.minimum(closest_d2, d2_c)
+
+    # Lloyd iterations
+    labels = None
+    for _ in range(max_iter):
+        new_labels = squared_distances_(centroids).argmin(axis=2)                           # (B, I, N)
+        one_hot = (new_labels[:, :, None, :] == np.arange(K)[:, None]) * w[:, :, None, :]   # (B, I, K, N)
+        cluster_weights = one_hot.sum(axis=-1)                                              # (B, I, K)
+        cluster_sums = one_hot @ points[:, None]                                            # (B, I, K, D)
+        new_centroids = np.where(cluster_weights[..., None] > 0,
+                                 cluster_sums / np.maximum(cluster_weights, 1e-12)[..., None], centroids)
+
+        shift = ((new_centroids - centroids) ** 2).sum(axis=(-1, -2))                       # (B, I)
+        converged = labels is not None and np.array_equal(labels, new_labels)
+        centroids, labels = new_centroids, new_labels
+
+        if converged or np.all(shift <= tolerances[:, None]):
+            break
+
+    d2 = squared_distances_(centroids)
+    labels = d2.argmin(axis=2)                                                               # (B, I, N)
+    inertia = (np.take_along_axis(d2, labels[:, :, None, :], axis=2)[:, :, 0] * w).sum(axis=-1)   # (B, I)
+    best = inertia.argmin(axis=1)
+
+    return centroids[np.arange(B), best], labels[np.arange(B), best]
+
+
+def compute_candidate_dominants_batch_(img_masked, n_candidates, n_init=10, seed=99):
+    """
+    .. description::
+    Function taking as input a batch of masked images img_masked (pytorch tensor of shape (n_masks, 3, H, W)) and
+    using clustering to identify n_candidates[i] candidate dominant colors in the i-th masked image, for all masked
+    images at once. Only the distinct colors inside each mask are clustered, weighted by their number of pixels,
+    while the black background enters the clustering as a single black color weighted by the number of background
+    pixels: the clustering objective is thus the same one of clustering all H * W pixels, at a fraction of the cost.
+
+    .. outputs::
+    Returns a tuple (candidates, colors, counts) of lists of length n_masks, where candidates[i] is a pytorch tensor
+    of shape (n_candidates[i], 3) containing the candidates of the i-th masked image, while colors[i] and counts[i]
+    are its distinct colors and their number of pixels (as returned by function masked_colors_).
+    """
+    assert(img_masked.shape[0] == len(n_candidates))
+
+    n_masks = img_masked.shape[0]
+    colors, counts = zip(*[ masked_colors_(img_masked[i]) for i in range(n_masks) ])
+    n_points = max(c.shape[0] for c in colors)
+
+    points = np.zeros((n_masks, n_points, 3))
+    weights = np.zeros((n_masks, n_points))
+    for i in range(n_masks):
+        points[i, :colors[i].shape[0]] = colors[i] / 255
+        weights[i, :counts[i].shape[0]] = counts[i]
+
+    centroids, _ = weighted_kmeans_batch_(points, weights, n_candidates, n_init=n_init, seed=seed)
+
+    candidates = [ torch.round(torch.from_numpy(centroids[i, :n_candidates[i]]) * 255).to(torch.uint8)
+                   for i in range(n_masks) ]
+    return candidates, list(colors), list(counts)
+
+
+def compute_candidate_dominants_histogram_(img_masked, n_candidates, n_bins=16):
+    """
+    .. description::
+    Function taking as input a batch of masked images img_masked (pytorch tensor of shape (n_masks, 3, H, W)) and
+    identifying n_candidates[i] candidate dominant colors in the i-th masked image without iterative clustering.
+    The non-black pixels of each masked image are quantized into a 3D histogram of n_bins ** 3 bins in CIELab, whose
+    modes are the most populated bins, skipping bins adjacent to an already selected one (unless there aren't enough
+    bins left). Each pixel is then assigned to the closest mode and candidates are the average colors of the
+    resulting groups. As with clustering, where one candidate always captures the black background, n_candidates[i] - 1
+    modes are picked and the remaining candidates are black (black candidates are never selected as dominants).
+
+    .. outputs::
+    Returns a tuple (candidates, colors, counts) of lists of length n_masks, with the same meaning of the output of
+    function compute_candidate_dominants_batch_.
+    """
+    assert(img_masked.shape[0] == len(n_candidates) and 256 % n_bins == 0)
+
+    bin_size = 256 // n_bins
+    candidates = []
+    colors_batch = []
+    counts_batch = []
+
+    for i in range(img_masked.shape[0]):
+        colors, counts = masked_colors_(img_masked[i])
+        colors_batch.append(colors)
+        counts_batch.append(counts)
+        non_black = colors.sum(axis=1) > 0
+        colors, counts = colors[non_black], counts[non_black]
+        candidates_i = torch.zeros((n_candidates[i], 3), dtype=torch.uint8)
+
+        if colors.shape[0] == 0:
+            candidates.append(candidates_i)
+            continue
+
+        colors_CIELab = cv2.cvtColor(colors.astype(np.uint8).reshape((-1, 1, 3)), cv2.COLOR_RGB2Lab).reshape((-1, 3))
+        bins_3d = colors_CIELab.astype(np.int64) // bin_size
+        bins = (bins_3d[:, 0] * n_bins + bins_3d[:, 1]) * n_bins + bins_3d[:, 2]
+
+        histogram = np.bincount(bins, weights=counts, minlength=n_bins ** 3)
+        occupied_bins = np.flatnonzero(histogram)
+        occupied_bins = occupied_bins[np.argsort(-histogram[occupied_bins], kind='stable')]
+        occupied_bins_3d = np.stack(np.unravel_index(occupied_bins, (n_bins, n_bins, n_bins)), axis=1)
+
+        # picking modes: most populated bins not adjacent to an already picked one
+        n_modes = max(n_candidates[i] - 1, 1)
+        modes = []
+        for b, bin_3d in enumerate(occupied_bins_3d):
+            if len(modes) == n_modes:
+                break
+            if all(np.abs(bin_3d - occupied_bins_3d[m]).max() > 1 for m in modes):
+                modes.append(b)
+
+        for b in range(len(occupied_bins)):
+            if len(modes) == n_modes:
+                break
+            if b not in modes:
+                modes.append(b)
+
+        # a single assignment step: each color goes to the closest mode (bin center), candidates are the average
+        # colors of the resulting groups
+        mode_centers = (occupied_bins_3d[modes] + 0.5) * bin_size
+        distances = ((colors_CIELab[:, None, :].astype(np.float64) - mode_centers[None, :, :]) ** 2).sum(axis=-1)
+        assignments = distances.argmin(axis=1)
+
+        for j in range(len(modes)):
+            assigned = assignments == j
+            mean_color = (colors[assigned] * counts[assigned, None]).sum(axis=0) / counts[assigned].sum()
+            candidates_i[j] = torch.from_numpy(np.round(mean_color)).to(torch.uint8)
+
+        candidates.append(candidates_i)
+
+    return candidates, colors_batch, counts_batch
+
+
 def compute_candidate_dominants_and_reconstructions_(img_masked, n_candidates, return_recs=True):
     """
     Function taking as input a masked image img_masked (pytorch tensor of shape (3, H, W)) and using clustering to
@@ -130,59 +374,72 @@ def compute_candidate_dominants_and_reconstructions_(img_masked, n_candidates, r
     Returns a tuple (candidates, None) or (candidates, reconstructions) as output.
     """
 
-    _, H, W = img_masked.shape
-    kmeans = KMeans(n_clusters=n_candidates, n_init=10, random_state=99)
-    mask_i = np.logical_not(color_mask(img_masked))                
-    img_masked_i_flattened = utils.from_DHW_to_HWD(img_masked).reshape((H * W, -1)) / 255
-        
-    # silencing kmeans convergence warnings
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", message='Number of distinct clusters*')
-        kmeans.fit(img_masked_i_flattened)
-
-    candidates = torch.round(torch.from_numpy(kmeans.cluster_centers_) * 255).to(torch.uint8)
+    candidates, _, _ = compute_candidate_dominants_batch_(img_masked.unsqueeze(axis=0), (n_candidates,))
+    candidates = candidates[0]
     
     if return_recs is True:
+        mask_i = np.logical_not(color_mask(img_masked))
         reconstructions = mask_i * candidates.unsqueeze(axis=2).unsqueeze(axis=3)
         return candidates, reconstructions
 
     return candidates, None
 
-def compute_user_embedding(img_masked, n_candidates, distance_fn, debug=False, eyes_idx=3):
+def compute_user_embedding(img_masked, n_candidates, distance_fn, debug=False, eyes_idx=3, method='kmeans',
+                           n_bins=16):
     """
     .. description::
-    Given a masked image of shape (4, 3, H, W) and a distance function computing a distance measure between two
-    images, returns a pytorch tensor of shape (4, 3, 1, 1) containing the dominant colors associated to each mask.
+    Given a masked image of shape (4, 3, H, W) and a distance function computing a distance measure between a masked
+    image and its reconstruction with a single color, returns a pytorch tensor of shape (4, 3, 1, 1) containing the
+    dominant colors associated to each mask.
     The four dominants are ordered as follows: skin dominant, hair dominant, lips dominant, eyes dominant.
     When comparing candidates, brighter colors are favored for skin, hair, lips dominants and darker colors are favored
     for the eyes dominant (this is done by appropriately) weighting the provided distance measure).
+    Each masked image is converted in CIELab only once, through its distinct colors, and reconstructions (obtained
+    by replacing all non-black pixels with a candidate) are never built: their brightness and distance from the
+    masked image are computed from the candidate color and the pixel counts of the distinct colors.
 
     .. inputs::
     n_candidates:   tuple of length 4 specifying how many candidates to consider for each mask when looking for a
                     dominant.
+    distance_fn:    function with the signature of metrics_and_losses.metrics.rmse_color_reconstruction.
     eyes_idx:       index of mask selecting the eyes of the user in img_masked.
+    method:         strategy used to find candidates; 'kmeans' to cluster pixels (more accurate), 'histogram' to
+                    pick modes of a color histogram (faster).
+    n_bins:         number of bins per channel of the color histogram, used only if method is 'histogram'.
     """
     assert(img_masked.shape[:2] == (4, 3) and len(n_candidates) == 4)
+    assert(method in ['kmeans', 'histogram'])
 
     _, _, H, W = img_masked.shape
     dominants = []
 
+    if method == 'kmeans':
+        candidates_batch, colors_batch, counts_batch = compute_candidate_dominants_batch_(img_masked, n_candidates)
+    elif method == 'histogram':
+        candidates_batch, colors_batch, counts_batch = compute_candidate_dominants_histogram_(
+            img_masked, n_candidates, n_bins)
+
     for i in range(4):
-        max_brightness_i = cv2.cvtColor(utils.from_DHW_to_HWD(
-            img_masked[i] / 255).numpy().astype(np.float32), cv2.COLOR_RGB2HSV)[:, :, 2].max()
-        candidates, reconstructions = compute_candidate_dominants_and_reconstructions_(
-            img_masked[i], n_candidates[i])
+        candidates = candidates_batch[i]
+        non_black = colors_batch[i].sum(axis=1) > 0
+        colors, counts = colors_batch[i][non_black].astype(np.uint8), counts_batch[i][non_black]
+        n_masked_pixels = counts.sum()
+
+        # brightness (value in HSV) of a color is its maximum channel
+        max_brightness_i = colors.max() / 255 if colors.shape[0] > 0 else 0.0
+        colors_CIELab = cv2.cvtColor(colors.reshape((-1, 1, 3)), cv2.COLOR_RGB2Lab).reshape((-1, 3))
+        candidates_CIELab = cv2.cvtColor(
+            candidates.numpy().reshape((-1, 1, 3)), cv2.COLOR_RGB2Lab).reshape((-1, 3))
 
         min_reconstruction_error = -1 
         dominant = torch.zeros((3,), dtype=torch.uint8)
 
-        for j, reconstruction_j in enumerate(reconstructions):
-            if candidates[j].sum() < 20 or candidates[j].sum() > 700:
+        for j, candidate_j in enumerate(candidates):
+            if candidate_j.sum() < 20 or candidate_j.sum() > 700:
                 continue
             
-            average_brightness_j = cv2.cvtColor(utils.from_DHW_to_HWD(
-                reconstruction_j / 255).numpy().astype(np.float32), cv2.COLOR_RGB2HSV)[:, :, 2].mean()
-            reconstruction_error_j = distance_fn(img_masked[i], reconstruction_j).item()
+            average_brightness_j = (candidate_j.max().item() / 255) * n_masked_pixels / (H * W)
+            reconstruction_error_j = distance_fn(colors_CIELab, counts, candidates_CIELab[j], H * W).item()
 
             if i == eyes_idx:
                 # decrease RMSE of darker colors when computing eyes dominant
@@ -193,8 +450,9 @@ def compute_user_embedding(img_masked, n_candidates, distance_fn, debug=False, e
 
             # debug
             if debug is True:
-                r, g, b = candidates[j]
+                r, g, b = candidate_j
                 print(f'Candidate: ({r},{g},{b}), Weighted Reconstruction Error: {reconstruction_error_j}')
+                reconstruction_j = np.logical_not(color_mask(img_masked[i])) * candidate_j.reshape((3, 1, 1))
                 plt.figure(figsize=(20, 10))
                 plt.subplot(1, 2, 1)
                 plt.imshow(utils.from_DHW_to_HWD(reconstruction_j))
@@ -204,7 +462,7 @@ def compute_user_embedding(img_masked, n_candidates, distance_fn, debug=False, e
 
             if min_reconstruction_error == -1 or reconstruction_error_j < min_reconstruction_error:
                 min_reconstruction_error = reconstruction_error_j
-                dominant = candidates[j]
+                dominant = candidate_j
             
         dominants.append(dominant.tolist())
     
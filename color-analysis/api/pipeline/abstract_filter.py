@@ -1,5 +1,12 @@
 from abc import ABC, abstractmethod
 
+def is_plain_value_(value):
+    if isinstance(value, (tuple, list)):
+        return all(is_plain_value_(item) for item in value)
+
+    return value is None or isinstance(value, (bool, int, float, str))
+
+
 class AbstractFilter(ABC):
     """
     .. description:: 
@@ -42,4 +49,34 @@ class AbstractFilter(ABC):
                  info during execution or not.
         """
 
-        pass
\ No newline at end of file
+        pass
+
+    def execute_batch(self, inputs, device=None, verbose=False):
+        """
+        .. description::
+        Method called when executing the filter on a list of inputs, returning the list of outputs that
+        method execute would return for each input. By default, the filter is executed on each input one
+        after the other: filters able to process several inputs at once (e.g. with a single forward pass
+        of a model) are expected to override this method.
+
+        .. inputs::
+        inputs:  List of inputs of the filter, each expected to be the same type returned by method input_type.
+        device:  See method execute.
+        verbose: See method execute.
+        """
+
+        return [ self.execute(input, device, verbose) for input in inputs ]
+
+    def cache_key(self):
+        """
+        .. description::
+        Returns a string identifying the filter and its configuration, such that two filters with the same key
+        return the same output for the same input: it is used by pipeline.Pipeline to memoize outputs of the
+        filter. By default, the key is made of the name of the filter's class and of its attributes holding
+        plain values (numbers, strings, booleans, None and tuples or lists of them). Filters whose output also
+        depends on other attributes (e.g. the weights of a model) are expected to override this method, while
+        filters which shouldn't be memoized can return None.
+        """
+
+        config = { name: value for name, value in sorted(vars(self).items()) if is_plain_value_(value) }
+        return f'{type(self).__module__}.{type(self).__qualname__}:{config!r}'
\ No newline at end of file
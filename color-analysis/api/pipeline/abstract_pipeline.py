@@ -36,4 +36,20 @@ class AbstractPipeline(ABC):
                  info during execution or not.
         """
 
+        pass
+
+    @abstractmethod
+    def execute_batch(self, inputs, device=None, verbose=False):
+        """
+        .. description::
+        Abstract method to execute the pipeline on a list of inputs, returning the list of outputs that
+        method execute would return for each input. Each filter is executed on the whole batch of outputs
+        of the previous one (see method execute_batch of AbstractFilter).
+
+        .. inputs::
+        inputs:  List of inputs of the pipeline, each coinciding with the input of the first filter.
+        device:  See method execute.
+        verbose: See method execute.
+        """
+
         pass
\ No newline at end of file
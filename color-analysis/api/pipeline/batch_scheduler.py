@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatchScheduler:
+    """
+    .. description::
+    Scheduler gathering inputs submitted concurrently by different threads into micro-batches, which are executed
+    together by a single call to a batch function. A background thread waits for a first input, then keeps
+    collecting inputs until either max_batch_size inputs have been gathered or max_wait seconds have passed since
+    the first one was submitted, and finally executes the batch function on all of them; the i-th output of the
+    batch function is returned to the submitter of the i-th input. Under low load, an input waits at most max_wait
+    seconds before being executed on its own; under high load, inputs are executed in full batches.
+    Typical usage is wrapping method execute_batch of a filter (e.g. pipeline.segmentation_filter.SegmentationFilter),
+    so that a single forward pass of its model serves concurrent requests.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait=0.01):
+        """
+        .. inputs::
+        batch_fn:       function taking as input a list of inputs and returning the list of corresponding outputs.
+        max_batch_size: maximum number of inputs executed together.
+        max_wait:       maximum time in seconds waited for further inputs after the first input of a batch.
+        """
+        assert(max_batch_size >= 1 and max_wait >= 0)
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue_ = queue.Queue()
+        self.n_batches_ = 0
+        self.n_inputs_ = 0
+        self.worker_ = threading.Thread(target=self.run_, daemon=True)
+        self.worker_.start()
+
+    def submit(self, input):
+        """
+        .. description::
+        Submits input for execution in the next batch. Returns a concurrent.futures.Future whose result is the
+        output of the batch function for input; if the batch function raises an exception, said exception is
+        set on the futures of all inputs of the batch.
+        """
+        future = Future()
+        self.queue_.put((input, future))
+        return future
+
+    def __call__(self, input, timeout=None):
+        """
+        .. description::
+        Submits input and waits for its output.
+        """
+        return self.submit(input).result(timeout)
+
+    def average_batch_size(self):
+        return self.n_inputs_ / self.n_batches_ if self.n_batches_ > 0 else 0.0
+
+    def collect_batch_(self):
+        """
+        .. description::
+        Blocks until a first input is available, then gathers further inputs as described in the class
+        description. Returns the list of gathered (input, future) pairs.
+        """
+        batch = [self.queue_.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+
+            try:
+                batch.append(self.queue_.get(timeout=remaining) if remaining > 0 else self.queue_.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def run_(self):
+        while True:
+            batch = self.collect_batch_()
+            inputs = [ input for input, _ in batch ]
+            futures = [ future for _, future in batch ]
+
+            try:
+                outputs = self.batch_fn(inputs)
+                assert(len(outputs) == len(inputs))
+            except BaseException as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.n_batches_ += 1
+            self.n_inputs_ += len(inputs)
+
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
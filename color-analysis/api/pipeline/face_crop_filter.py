@@ -0,0 +1,86 @@
+from .abstract_filter import AbstractFilter
+import os
+import PIL
+import cv2
+import numpy as np
+
+
+class FaceCropFilter(AbstractFilter):
+    """
+    .. description::
+    Filter cropping the input image, expected to be the image of a user, to the region of the user's head, so that
+    a segmentation filter placed after it runs on fewer pixels and sees the face at a higher resolution (the
+    segmentation model resizes its input to a fixed size). Faces are detected with a Haar cascade of OpenCV on a
+    downscaled grayscale copy of the image; the box of the largest face is then enlarged by margins proportional
+    to its size, in order to include hair and neck, and clipped to the image. If no face is found (or the cascade
+    isn't available), the full image is returned. The filter returns a PIL image, like its input. Please note that
+    the filter doesn't support execution on gpu, and thus the device parameter of method execute has no effect on
+    execution. The filter supports the printing of additional information through verbose parameter of method
+    execute.
+    """
+
+    def __init__(self, margins=(0.6, 0.4, 0.4, 0.4), detection_size=160, cascade_path=None):
+        """
+        .. inputs::
+        margins:        tuple (top, bottom, left, right) of margins added to the box of the detected face,
+                        as fractions of its height (top, bottom) and width (left, right).
+        detection_size: size of the longest side of the image on which faces are detected.
+        cascade_path:   path of the Haar cascade to use; if None, the frontal face cascade bundled with OpenCV.
+        """
+        assert(all(margin >= 0 for margin in margins) and detection_size > 0)
+
+        if cascade_path is None and hasattr(cv2, 'data'):
+            cascade_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+
+        self.margins = margins
+        self.detection_size = detection_size
+        # Haar cascades aren't part of every OpenCV build (e.g. OpenCV 5 moved them out of the main modules)
+        cascade_classifier = getattr(cv2, 'CascadeClassifier', None)
+        self.cascade = cascade_classifier(cascade_path) \
+            if cascade_path is not None and cascade_classifier is not None else None
+
+        if self.cascade is not None and self.cascade.empty():
+            self.cascade = None
+
+    def input_type(self):
+        return PIL.Image.Image
+
+    def output_type(self):
+        return PIL.Image.Image
+
+    def detect_face_(self, input):
+        """
+        .. description::
+        Returns the box (x, y, w, h) of the largest face found in input, in coordinates of input, or None.
+        """
+        W, H = input.size
+        scale = min(1.0, self.detection_size / max(W, H))
+        img = np.asarray(input.convert('L').resize((max(1, round(W * scale)), max(1, round(H * scale)))))
+        img = cv2.equalizeHist(img)
+        min_face_size = max(1, min(img.shape) // 8)
+        faces = self.cascade.detectMultiScale(img, scaleFactor=1.1, minNeighbors=5, minSize=(min_face_size, min_face_size))
+
+        if len(faces) == 0:
+            return None
+
+        x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+        return x / scale, y / scale, w / scale, h / scale
+
+    def execute(self, input, device=None, verbose=False):
+        face = self.detect_face_(input) if self.cascade is not None else None
+
+        if face is None:
+            if verbose:
+                print('No face found, keeping full image.')
+            return input
+
+        x, y, w, h = face
+        top, bottom, left, right = self.margins
+        W, H = input.size
+        box = (max(0, int(x - left * w)), max(0, int(y - top * h)),
+               min(W, int(np.ceil(x + w + right * w))), min(H, int(np.ceil(y + h + bottom * h))))
+
+        if verbose:
+            print(f'Face found, cropping image of size {input.size} to box {box}.')
+
+        return input.crop(box)
@@ -0,0 +1,147 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+import torch
+import PIL
+
+
+def content_hash(obj):
+    """
+    .. description::
+    Returns the hex SHA-256 digest of the content of obj, which can be a PIL image, a pytorch tensor, a numpy array
+    or a tuple, list or dictionary of them; other objects are hashed through their pickled representation. Equal
+    contents hash to the same value, regardless of the identity of the objects holding them.
+    """
+    digest = hashlib.sha256()
+    update_hash_(digest, obj)
+    return digest.hexdigest()
+
+
+def update_hash_(digest, obj):
+    if isinstance(obj, PIL.Image.Image):
+        digest.update(f'image:{obj.mode}:{obj.size}:'.encode())
+        digest.update(obj.tobytes())
+    elif isinstance(obj, torch.Tensor):
+        digest.update(f'tensor:{obj.dtype}:{tuple(obj.shape)}:'.encode())
+        digest.update(obj.detach().to('cpu').contiguous().numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        digest.update(f'array:{obj.dtype}:{obj.shape}:'.encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (tuple, list)):
+        digest.update(f'{type(obj).__name__}:{len(obj)}:'.encode())
+        for item in obj:
+            update_hash_(digest, item)
+    elif isinstance(obj, dict):
+        digest.update(f'dict:{len(obj)}:'.encode())
+        for key in sorted(obj, key=repr):
+            update_hash_(digest, key)
+            update_hash_(digest, obj[key])
+    else:
+        digest.update(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class OutputCache:
+    """
+    .. description::
+    On-disk store of the outputs of pipeline filters, used by pipeline.Pipeline to memoize them (see its
+    constructor). Each output is pickled to a file of directory path, named after its key. Outputs are evicted in
+    least recently used order once the store exceeds max_size_mb megabytes: the modification time of a file is
+    refreshed whenever its output is read, and serves as its last access time. Files are written atomically, so
+    that several processes can share the same store.
+    """
+
+    def __init__(self, path, max_size_mb=1024):
+        """
+        .. inputs::
+        path:        directory of the store, created if missing.
+        max_size_mb: maximum size of the store in megabytes.
+        """
+        assert(max_size_mb > 0)
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_size = max_size_mb * 2 ** 20
+        self.size_ = sum(entry.stat().st_size for entry in self.entries_())
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def entries_(self):
+        return [ entry for entry in os.scandir(self.path) if entry.is_file() and entry.name.endswith('.pkl') ]
+
+    def filename_(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def get(self, key):
+        """
+        .. description::
+        Returns a tuple (found, output), where found is False if no output is stored under key (output is then None).
+        """
+        filename = self.filename_(key)
+
+        try:
+            with open(filename, 'rb') as output_file:
+                output = pickle.load(output_file)
+            os.utime(filename)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # missing, or evicted by another process in the meantime
+            self.n_misses += 1
+            return False, None
+
+        self.n_hits += 1
+        return True, output
+
+    def set(self, key, output):
+        """
+        .. description::
+        Stores output under key, evicting least recently used outputs if the store exceeds its maximum size.
+        """
+        file_descriptor, temp_filename = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+
+        with os.fdopen(file_descriptor, 'wb') as output_file:
+            pickle.dump(output, output_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        filename = self.filename_(key)
+        try:
+            # the output replaces the one already stored under key, if any
+            replaced_size = os.path.getsize(filename)
+        except FileNotFoundError:
+            replaced_size = 0
+
+        self.size_ += os.path.getsize(temp_filename) - replaced_size
+        os.replace(temp_filename, filename)
+
+        if self.size_ > self.max_size:
+            self.evict_()
+
+    def evict_(self):
+        # the size is tracked incrementally, and recomputed from the directory (shared with other processes) here
+        entries = []
+        for entry in self.entries_():
+            try:
+                entries.append((entry.path, entry.stat()))
+            except FileNotFoundError:
+                pass
+
+        entries.sort(key=lambda entry: entry[1].st_mtime)
+        self.size_ = sum(stat.st_size for _, stat in entries)
+
+        for filename, stat in entries:
+            if self.size_ <= self.max_size:
+                break
+
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            self.size_ -= stat.st_size
+
+    def clear(self):
+        for entry in self.entries_():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+        self.size_ = 0
@@ -1,26 +1,142 @@
 from .abstract_pipeline import AbstractPipeline
+from . import profiling
+from .output_cache import content_hash
+import hashlib
 
 class Pipeline(AbstractPipeline):
-    def __init__(self):
+    def __init__(self, cache=None):
+        """
+        .. inputs::
+        cache: optional store of filter outputs (instance of pipeline.output_cache.OutputCache). If provided, the
+               output of each filter is memoized under a key combining the content of the pipeline's input with
+               the cache keys of the filter and of the filters preceding it (see method cache_key of
+               AbstractFilter): executions then resume from the output of the last filter found in the cache,
+               e.g. re-running only the filters following a reconfigured one.
+        """
         self.filters = []
+        self.filter_names = []
+        self.cache = cache
 
     def filters(self):
         """
-        .. description:: 
+        .. description::
         Method returning the list of filters composing the pipeline.
         """
 
         return self.filters
 
-    def add_filter(self, filter):
+    def add_filter(self, filter, name=None):
+        """
+        .. description::
+        Adds filter at the end of the pipeline.
+
+        .. inputs::
+        filter: A filter. Filters are expected to implement AbstractFilter's interface.
+        name:   Name under which the timings of the filter are recorded by method execute. If None, the name
+                of the filter's class.
+        """
         assert(len(self.filters) == 0 or self.filters[-1].output_type() == filter.input_type())
         self.filters.append(filter)
+        self.filter_names.append(type(filter).__name__ if name is None else name)
 
-    def execute(self, input, device=None, verbose=False):
-        last_output = input
+    def cache_keys_(self, input):
+        """
+        .. description::
+        Returns the list of keys under which the outputs of the filters for input are memoized. Filters
+        following a filter which isn't memoized (whose cache key is None) aren't memoized either.
+        """
+        keys = []
+        key = content_hash(input)
 
         for filter in self.filters:
-            current_output = filter.execute(last_output, device, verbose)
+            filter_key = filter.cache_key()
+            key = None if key is None or filter_key is None \
+                else hashlib.sha256(f'{key}:{filter_key}'.encode()).hexdigest()
+            keys.append(key)
+
+        return keys
+
+    def resume_point_(self, input, keys):
+        """
+        .. description::
+        Returns a tuple (index, output), where index is the index of the first filter to execute and output its
+        input, taken from the cache if the output of a previous filter is found.
+        """
+        for index in reversed(range(len(self.filters))):
+            if keys[index] is not None:
+                found, output = self.cache.get(keys[index])
+                if found:
+                    return index + 1, output
+
+        return 0, input
+
+    def execute(self, input, device=None, verbose=False, timings=None):
+        """
+        .. description::
+        Executes the filters of the pipeline one after the other. If timings is a dictionary, the wall time,
+        cpu time and peak memory of each filter are recorded in it under the name of the filter (see
+        function profiling.profile_stage); filters skipped thanks to the cache aren't recorded.
+        """
+        keys = None if self.cache is None else self.cache_keys_(input)
+        first_index, last_output = (0, input) if keys is None else self.resume_point_(input, keys)
+
+        for index in range(first_index, len(self.filters)):
+            with profiling.profile_stage(self.filter_names[index], timings):
+                current_output = self.filters[index].execute(last_output, device, verbose)
             last_output = current_output
-        
-        return last_output
\ No newline at end of file
+
+            if keys is not None and keys[index] is not None:
+                self.cache.set(keys[index], last_output)
+
+        return last_output
+
+    def execute_batch(self, inputs, device=None, verbose=False, batch_size=None, timings=None):
+        """
+        .. description::
+        Executes the pipeline on a list of inputs, each filter being executed on a whole batch at once through
+        its method execute_batch. Inputs are processed in batches of at most batch_size inputs (all at once if
+        None), so that intermediate outputs (e.g. images and segmentation masks) are only kept in memory for a
+        batch at a time. If timings is a dictionary, timings of each filter are recorded in it as in method
+        execute, wall and cpu times being summed over batches. With a cache, the inputs of a batch resuming
+        from the same filter are executed together.
+        """
+        assert(batch_size is None or batch_size > 0)
+
+        batch_size = max(1, len(inputs)) if batch_size is None else batch_size
+        outputs = []
+
+        for batch_start in range(0, len(inputs), batch_size):
+            batch = inputs[batch_start:batch_start + batch_size]
+
+            if self.cache is None:
+                keys = [ None ] * len(batch)
+                resume_points = [ (0, input) for input in batch ]
+            else:
+                keys = [ self.cache_keys_(input) for input in batch ]
+                resume_points = [ self.resume_point_(input, input_keys) for input, input_keys in zip(batch, keys) ]
+
+            batch_outputs = [ None ] * len(batch)
+
+            for first_index in sorted(set(index for index, _ in resume_points)):
+                positions = [ i for i, (index, _) in enumerate(resume_points) if index == first_index ]
+                last_outputs = [ resume_points[i][1] for i in positions ]
+                batch_timings = None if timings is None else {}
+
+                for index in range(first_index, len(self.filters)):
+                    with profiling.profile_stage(self.filter_names[index], batch_timings):
+                        current_outputs = self.filters[index].execute_batch(last_outputs, device, verbose)
+                    last_outputs = current_outputs
+
+                    for i, output in zip(positions, last_outputs):
+                        if keys[i] is not None and keys[i][index] is not None:
+                            self.cache.set(keys[i][index], output)
+
+                for i, output in zip(positions, last_outputs):
+                    batch_outputs[i] = output
+
+                if timings is not None:
+                    profiling.accumulate_timings(timings, batch_timings)
+
+            outputs.extend(batch_outputs)
+
+        return outputs
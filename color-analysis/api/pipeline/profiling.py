@@ -0,0 +1,183 @@
+import sys
+import time
+import platform
+import resource
+import threading
+from os import path
+from collections import Counter
+from contextlib import contextmanager
+
+
+def status_mb_(field):
+    # fields of /proc/self/status are in kilobytes, None if it isn't available (not on linux)
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    """
+    .. description::
+    Returns the resident set size of the current process in MB, or None if it can't be read (not on linux).
+    """
+    return status_mb_('VmRSS')
+
+
+def peak_rss_mb():
+    """
+    .. description::
+    Returns the peak resident set size of the current process in MB, i.e. its high-water mark since it started
+    or since the last call of function reset_peak_rss.
+    """
+    peak = status_mb_('VmHWM')
+    if peak is not None:
+        return peak
+
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    scale = 2 ** 20 if platform.system() == 'Darwin' else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def reset_peak_rss():
+    """
+    .. description::
+    Resets the peak resident set size of the current process to its current one, so that function peak_rss_mb
+    returns the peak reached from now on. It relies on /proc/self/clear_refs (linux only) and returns whether the
+    peak could be reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs_file:
+            clear_refs_file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+@contextmanager
+def profile_stage(name, timings):
+    """
+    .. description::
+    Context manager recording in timings[name] the wall time and cpu time (in ms) spent executing its body, and
+    the peak RSS of the process (in MB) while executing it, along with how much that peak exceeds the RSS at the
+    start of the body (peak_rss_delta_mb, None if the RSS can't be read). Cpu time and memory are the ones of the whole process, so that work
+    handed off to other threads (e.g. intra-op threads of torch) is accounted for: they are accurate as long as
+    the process runs a single request at a time. The peak RSS is reset at the start of the body where possible
+    (see function reset_peak_rss): elsewhere it is the high-water mark of the process, and only stages raising it
+    are measured. If timings is None, nothing is recorded.
+    """
+    if timings is None:
+        yield
+        return
+
+    reset_peak_rss()
+    rss_start = rss_mb()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        peak_rss = peak_rss_mb()
+        timings[name] = {
+            'wall_ms': 1000 * (time.perf_counter() - wall_start),
+            'cpu_ms': 1000 * (time.process_time() - cpu_start),
+            'peak_rss_mb': peak_rss,
+            'peak_rss_delta_mb': max(peak_rss - rss_start, 0) if rss_start is not None else None,
+        }
+
+
+def accumulate_timings(timings, other_timings):
+    """
+    .. description::
+    Adds other_timings, recorded by function profile_stage, to timings: wall and cpu times of stages found in both
+    are summed, while their peak RSS (and its delta) is the largest one.
+    """
+    for name, timing in other_timings.items():
+        if name not in timings:
+            timings[name] = dict(timing)
+            continue
+
+        timings[name]['wall_ms'] += timing['wall_ms']
+        timings[name]['cpu_ms'] += timing['cpu_ms']
+        timings[name]['peak_rss_mb'] = max(timings[name]['peak_rss_mb'], timing['peak_rss_mb'])
+        if timing['peak_rss_delta_mb'] is not None:
+            timings[name]['peak_rss_delta_mb'] = max(timings[name]['peak_rss_delta_mb'], timing['peak_rss_delta_mb'])
+
+
+class SamplingProfiler:
+    """
+    .. description::
+    Statistical profiler which, once started, samples the call stack of the thread which started it every
+    interval seconds from a background thread, until stopped. It can be used as a context manager. Samples are
+    aggregated as collapsed stacks: one line for each distinct stack, with frames from outermost to innermost
+    separated by semicolons, followed by its number of samples, which is the input format of flame graph tools
+    such as flamegraph.pl and speedscope. Its overhead is the one of a thread waking up every interval seconds,
+    so that it can run on every request and its samples be saved only for slow ones.
+    """
+
+    def __init__(self, interval=0.01, max_depth=128):
+        """
+        .. inputs::
+        interval:  time in seconds between two samples.
+        max_depth: maximum number of frames of a sampled stack, the innermost ones being kept.
+        """
+        assert(interval > 0 and max_depth > 0)
+
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.thread_id = None
+        self.stop_event = None
+        self.thread = None
+
+    def start(self):
+        self.samples = Counter()
+        self.thread_id = threading.get_ident()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run_, name='sampling-profiler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        .. description::
+        Stops sampling and returns the collected samples, as a Counter mapping collapsed stacks to their number
+        of samples.
+        """
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+        return self.samples
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def run_(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+
+            if len(stack) > 0:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def save(self, filename):
+        """
+        .. description::
+        Saves the collected samples to filename as collapsed stacks, most sampled stacks first.
+        """
+        with open(filename, 'w') as profile_file:
+            for stack, n_samples in self.samples.most_common():
+                profile_file.write(f'{stack} {n_samples}\n')
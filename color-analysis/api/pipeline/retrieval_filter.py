@@ -5,11 +5,12 @@ sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 # ---
 
 from .abstract_filter import AbstractFilter
+from .output_cache import content_hash
 from utils import model_names
 from models import dataset
 from palette_classification import palette
 from palette_classification.palettes import mappings
-from retrieval import training_and_testing_retrieval
+from retrieval import training_and_testing_retrieval, embedding_index
 import torch
 import open_clip
 
@@ -21,9 +22,12 @@ class RetrievalFilter(AbstractFilter):
     to method execute). The filter returns the paths of all compatible clothing images as a list.
     Moreover, the filter supports execution both on cpu and gpu. The filter doesn't support
     the printing of additional information through verbose parameter of method execute.
+    If an index path is provided, clothing images are retrieved from an index of precomputed image embeddings
+    (see retrieval.embedding_index.ClothEmbeddingIndex), loaded the first time the filter is executed and built
+    if missing, instead of encoding the whole dataset at each execution.
     """
     
-    def __init__(self, cloth_dataset_path, palette_mappings_dict): 
+    def __init__(self, cloth_dataset_path, palette_mappings_dict, index_path=None): 
         """
         .. inputs::
         cloth_dataset_path:     path of dataset of clothing items; the dataset is expected to have a sub-folder
@@ -32,6 +36,8 @@ class RetrievalFilter(AbstractFilter):
         palette_mappings_dict:  dictionary of n_categories couples (key, value) where each key is a category
                                 of clothing item and each value is the mapping dictionary for said category
                                 (a dictionary assigning a palette id to each image).
+        index_path:             directory of the index of precomputed image embeddings of the dataset; if None,
+                                the dataset is encoded at each execution of the filter.
         """
 
         clip_model = 'ViT-B-32'
@@ -46,7 +52,12 @@ class RetrievalFilter(AbstractFilter):
         self.dataset_path = cloth_dataset_path
         self.palette_mappings_dict = palette_mappings_dict
         self.query = None
+        self.index_path = index_path
+        self.index = None
        
+    def cache_key(self):
+        return f'{super().cache_key()}:{content_hash(self.palette_mappings_dict)}'
+
     def input_type(self):
         return palette.PaletteRGB
 
@@ -59,25 +70,61 @@ class RetrievalFilter(AbstractFilter):
     def get_query(self):
         return self.query
 
+    def get_index_(self, device):
+        """
+        .. description::
+        Returns the index of precomputed image embeddings, loading it (or building it, if missing) on first call.
+        """
+
+        if self.index is None:
+            index = embedding_index.ClothEmbeddingIndex(self.index_path)
+
+            if index.exists():
+                index.load()
+            else:
+                index.build(device, self.model, self.dataset)
+
+            self.index = index
+
+        return self.index
+
     def execute(self, input, device=None, verbose=False):
+        return self.execute_batch([input], device, verbose)[0]
+
+    def execute_batch(self, inputs, device=None, verbose=False):
+        """
+        .. description::
+        Executes the filter on a list of input palettes. Since the query is the same for all of them, clothing
+        images satisfying the query are retrieved only once (e.g. the dataset is encoded once instead of once
+        for each palette), and then filtered by the palette of each input.
+        """
         assert(self.query is not None)
 
-        filtered_cloth_paths = []
-        input_palette_id = mappings.DESC_ID_MAPPING[input.description()]
-        
+        if len(inputs) == 0:
+            return []
+
         if device is None:
             device = 'cuda' if torch.cuda.is_available() else 'cpu'
         
-        cloth_paths = training_and_testing_retrieval.retrieve_clothes(
-            device, self.model, self.tokenizer, self.query, self.dataset, k=-1, batch_size=32)
-        
+        if self.index_path is not None:
+            text_features = training_and_testing_retrieval.compute_query_features(
+                device, self.model, self.tokenizer, self.query)
+            cloth_paths, _ = self.get_index_(device).search(text_features, k=-1)
+        else:
+            cloth_paths = training_and_testing_retrieval.retrieve_clothes(
+                device, self.model, self.tokenizer, self.query, self.dataset, k=-1, batch_size=32)
+
+        cloth_palette_ids = []
         for cloth_path in cloth_paths:
             cloth_path_tokens = cloth_path.split('/')
             category = cloth_path_tokens[-3]
             cloth_filename = cloth_path_tokens[-1]
-            cloth_palette_id = self.palette_mappings_dict[category][cloth_filename]
+            cloth_palette_ids.append(self.palette_mappings_dict[category][cloth_filename])
 
-            if input_palette_id == cloth_palette_id:
-                filtered_cloth_paths.append(cloth_path)
+        outputs = []
+        for input in inputs:
+            input_palette_id = mappings.DESC_ID_MAPPING[input.description()]
+            outputs.append([ cloth_path for cloth_path, cloth_palette_id in zip(cloth_paths, cloth_palette_ids)
+                             if input_palette_id == cloth_palette_id ])
 
-        return filtered_cloth_paths
\ No newline at end of file
+        return outputs
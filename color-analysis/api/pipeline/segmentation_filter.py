@@ -5,11 +5,12 @@ sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 # ---
 
 from .abstract_filter import AbstractFilter
+import os
 import PIL
 import torch
 from torch import nn
 import torchvision.transforms as T
-from models import config
+from models import config, inference_backends
 from slurm_scripts import slurm_config
 from models.local.FastSCNN.models import fast_scnn
 from models.cloud.UNet import unet
@@ -22,13 +23,24 @@ class SegmentationFilter(AbstractFilter):
     The filter returns a tuple containing both the input image (converted into a pytorch tensor) and 
     its segmentation masks. The segmentation model used for predictions can be configured through the 
     model parameter of the class constructor ('local' for the less accurate but lighter model, 
-    'cloud' for the more accurate but heavier one). Moreover, the filter supports execution both 
-    on cpu and gpu. The filter doesn't support the printing of additional information through verbose
+    'cloud' for the more accurate but heavier one, 'int8' and 'local_int8' for the int8 quantizations of the
+    'cloud' and 'local' models, see models/quantization.py). Moreover, the filter supports execution both on cpu
+    and gpu, except for int8 models, which always run on cpu. The filter doesn't support the printing of additional information through verbose
     parameter of method execute.
+    Through the output parameter of the class constructor, segmentation masks can be returned either as a
+    boolean pytorch tensor of shape (n_labels, H, W) ('masks') or as a compact label map, a uint8 pytorch 
+    tensor of shape (H, W) assigning to each pixel the index of its label ('labels').
+    Through the backend parameter of the class constructor, execution on cpu can use either the eager model
+    ('eager') or a frozen TorchScript graph of the model optimized for cpu inference ('torchscript', see 
+    models/inference_backends.py), exported next to the weights of the model the first time it is needed.
+    Execution on gpu always uses the eager model. Int8 models are loaded as TorchScript graphs, ignoring the
+    backend parameter.
     """
     
-    def __init__(self, model):
-        assert(model in ['local', 'cloud'])
+    def __init__(self, model, output='masks', backend=config.SEGMENTATION_BACKEND, n_threads=config.SEGMENTATION_N_THREADS):
+        assert(model in ['local', 'cloud', 'int8', 'local_int8'])
+        assert(output in ['masks', 'labels'])
+        assert(backend in ['eager', 'torchscript'])
 
         n_classes = len(segmentation_labels.labels)
         weights_path = config.WEIGHTS_PATH
@@ -42,10 +54,34 @@ class SegmentationFilter(AbstractFilter):
             model_name = 'unet_ccncsa_best'
             self.model = unet.UNet(out_channels=n_classes)
             model_cfg_best = slurm_config.configurations['best']['unet']
-  
-        self.model.load_state_dict(torch.load(weights_path + model_name + '.pth'))
+        elif model == 'int8':
+            model_name = 'unet_ccncsa_best_int8'
+            self.model = None
+            model_cfg_best = slurm_config.configurations['best']['unet']
+        elif model == 'local_int8':
+            model_name = 'fastscnn_ccncsa_best_int8'
+            self.model = None
+            model_cfg_best = slurm_config.configurations['best']['fastscnn']
+
         self.pil_to_tensor = T.Compose([T.PILToTensor()])
         self.transforms = model_cfg_best['image_transform_inference']
+        self.output = output
+        self.backend = None
+        # int8 models are always TorchScript graphs
+        self.backend_name = backend if self.model is not None else 'torchscript'
+        self.model_name = model_name
+        self.weights_filename = weights_path + model_name + ('.torchscript.pt' if self.model is None else '.pth')
+
+        if self.model is None:
+            self.backend = inference_backends.TorchScriptBackend(
+                self.weights_filename, model_cfg_best['input_size'], channels_last=False, n_threads=n_threads)
+            return
+
+        self.model.load_state_dict(torch.load(self.weights_filename))
+
+        if backend == 'torchscript':
+            self.backend = inference_backends.load_torchscript_backend(
+                self.model, weights_path + model_name + '.pth', model_cfg_best['input_size'], n_threads=n_threads)
        
     def input_type(self):
         return PIL.Image.Image
@@ -53,25 +89,56 @@ class SegmentationFilter(AbstractFilter):
     def output_type(self):
         return tuple
 
+    def cache_key(self):
+        # outputs change whenever the weights are updated, e.g. by a new training, and aren't bit-identical
+        # across backends
+        return (f'{type(self).__qualname__}:{self.model_name}:{self.output}:{self.backend_name}:'
+                f'{os.path.getmtime(self.weights_filename)}')
+
     def execute(self, input, device=None, verbose=False):
-        if device is None:
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        return self.execute_batch([input], device, verbose)[0]
 
-        input = self.pil_to_tensor(input)
+    def execute_batch(self, inputs, device=None, verbose=False):
+        """
+        .. description::
+        Executes the filter on a list of input images with a single forward pass of the segmentation model.
+        Since the inference transforms of the model resize every image to the same input size, images of 
+        different sizes can be stacked into a single batch; each prediction is then resized back to the size of
+        its own image. Returns the list of outputs that method execute would return for each image.
+        """
+        if device is None or self.model is None:
+            device = 'cuda' if torch.cuda.is_available() and self.model is not None else 'cpu'
+
+        inputs = [ self.pil_to_tensor(input) for input in inputs ]
+        inputs_transformed = torch.stack([ self.transforms(input / 255) for input in inputs ])
+        inputs_transformed = inputs_transformed.to(device)
+
+        if self.backend is not None and device == 'cpu':
+            outputs = self.backend(inputs_transformed)[0]
+        else:
+            with torch.no_grad():
+                self.model = self.model.to(device)
+                self.model.eval()
+                outputs = self.model(inputs_transformed)[0]
+
+        return [ self.postprocess_(input, output.unsqueeze(axis=0)) for input, output in zip(inputs, outputs) ]
+
+    def postprocess_(self, input, output):
+        """
+        .. description::
+        Converts the output of the segmentation model for a single image, a pytorch tensor of shape 
+        (1, n_labels, H_model, W_model), into the output of the filter for said image.
+        """
         _, H, W = input.shape
-        resize = T.Compose([T.Resize((H, W))])
-        input_transformed = self.transforms(input / 255)
-        input_transformed = torch.unsqueeze(input_transformed, axis=0)
-        input = input.to(device)
-        input_transformed = input_transformed.to(device)
 
-        with torch.no_grad():
-            self.model = self.model.to(device)
-            self.model.eval()
-            output = self.model(input_transformed)[0]
+        if self.output == 'labels':
+            label_map = torch.argmax(output, dim=1).to(torch.uint8)
+            label_map = T.Resize((H, W), interpolation=T.InterpolationMode.NEAREST)(label_map)[0]
+            return (input, label_map.to('cpu'))
 
+        resize = T.Compose([T.Resize((H, W))])
         channels_max, _ = torch.max(output, dim=1)
         prediction = (output == channels_max.unsqueeze(axis=1))[0]
         prediction = resize(prediction)
 
-        return (input.to('cpu'), prediction.to('cpu'))
+        return (input, prediction.to('cpu'))
@@ -5,32 +5,43 @@ sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 # ---
 
 from .abstract_filter import AbstractFilter
+from .output_cache import content_hash
 from metrics_and_losses import metrics
 import utils.utils as utils
 from palette_classification import color_processing, palette
 from utils import utils, segmentation_labels
+from concurrent.futures import ThreadPoolExecutor
 
 class UserPaletteClassificationFilter(AbstractFilter):
     """
     .. description:: 
     Filter taking as input a tuple (image, segmentation_masks) of pytorch tensors (in the format returned by 
-    a segmentation filter) of the user and assigning the corresponding palette object according 
+    a segmentation filter, either with output 'masks' or 'labels') of the user and assigning the corresponding palette object according 
     to color harmony theory. The filter returns said palette object as output. Please note that the
     filter doesn't support execution on gpu, and thus the device parameter of method execute has no
     effect on execution. The filter supports the printing of additional information through verbose
     parameter of method execute.
+    Method execute_batch classifies the inputs of a batch concurrently on n_workers threads: the extraction of
+    dominant colors spends most of its time in numpy operations on whole arrays, which release the GIL.
     """
     
-    def __init__(self, reference_palettes, thresholds=(0.200, 0.422, 0.390)):
+    def __init__(self, reference_palettes, thresholds=(0.200, 0.422, 0.390), dominants_method='kmeans', n_workers=4):
         """
         .. inputs::
         reference_palettes: list of palette objects (instances of palette_classification.palette.PaletteRGB) 
                             to use as reference for classification.
         thresholds:         tuple of thresholds to use when binarizing values of metrics contrast, 
                             intensity, value (values must be between 0 and 1).
+        dominants_method:   strategy used to compute dominant colors ('kmeans' for the more accurate clustering,
+                            'histogram' for the faster color histogram), see 
+                            palette_classification.color_processing.compute_user_embedding.
+        n_workers:          number of threads classifying the inputs of a batch in method execute_batch (1 to
+                            classify them sequentially).
         """
 
         assert(0 <= thresholds[0] <= 1 and 0 <= thresholds[1] <= 1 and 0 <= thresholds[2] <= 1)
+        assert(dominants_method in ['kmeans', 'histogram'])
+        assert(n_workers >= 1)
 
         relevant_labels = ['skin', 'hair', 'lips', 'eyes']
         self.relevant_indexes = [ 
@@ -38,7 +49,14 @@ class UserPaletteClassificationFilter(AbstractFilter):
         self.skin_idx, self.hair_idx, self.lips_idx, self.eyes_idx = (0, 1, 2, 3)
         self.reference_palettes = reference_palettes
         self.thresholds = thresholds
+        self.dominants_method = dominants_method
+        self.n_workers = n_workers
         
+    def cache_key(self):
+        reference_palettes = [ (reference_palette.description(), reference_palette.colors(), 
+                                reference_palette.metrics_vector()) for reference_palette in self.reference_palettes ]
+        return f'{super().cache_key()}:{content_hash(reference_palettes)}'
+
     def input_type(self):
         return tuple
 
@@ -47,11 +65,18 @@ class UserPaletteClassificationFilter(AbstractFilter):
 
     def execute(self, input, device=None, verbose=False):
         img, masks = input
-        relevant_masks = masks[self.relevant_indexes, :, :]
+
+        if len(masks.shape) == 2:
+            # label map returned by a segmentation filter with output 'labels'
+            relevant_masks = color_processing.compute_segmentation_masks_from_label_map(masks, self.relevant_indexes)
+        else:
+            relevant_masks = masks[self.relevant_indexes, :, :]
+
         img_masked = color_processing.apply_masks(img, relevant_masks)
         
         dominants = color_processing.compute_user_embedding(
-            img_masked, n_candidates=(3, 3, 3, 3), distance_fn=metrics.rmse, debug=verbose)
+            img_masked, n_candidates=(3, 3, 3, 3), distance_fn=metrics.rmse_color_reconstruction, debug=verbose,
+            method=self.dominants_method)
         dominants_palette = palette.PaletteRGB('dominants', dominants)
         
         hair_dominant = dominants[self.hair_idx] if relevant_masks[self.hair_idx].sum() > 0 else None
@@ -70,4 +95,12 @@ class UserPaletteClassificationFilter(AbstractFilter):
             print(dominants_palette.description())
             dominants_palette.plot()
 
-        return user_palette
\ No newline at end of file
+        return user_palette
+
+    def execute_batch(self, inputs, device=None, verbose=False):
+        if self.n_workers == 1 or len(inputs) <= 1 or verbose is True:
+            # plots of verbose executions aren't thread safe
+            return [ self.execute(input, device, verbose) for input in inputs ]
+
+        with ThreadPoolExecutor(min(self.n_workers, len(inputs))) as executor:
+            return list(executor.map(lambda input: self.execute(input, device, verbose), inputs))
\ No newline at end of file
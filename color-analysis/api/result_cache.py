@@ -0,0 +1,127 @@
+# result_cache.py
+import hashlib
+import json
+import os
+import time
+import redis
+import analysis_config
+
+cache_url = os.environ.get("RESULT_CACHE_URL", os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0"))
+cache_ttl = int(os.environ.get("RESULT_CACHE_TTL", str(24 * 60 * 60)))  # seconds, 0 disables the cache
+cache_max_entries = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "10000"))
+
+
+def image_hash(image) -> str:
+    """
+    Returns the hex SHA-256 digest of the pixels of a decoded PIL image, together with its size and mode,
+    so that re-uploads of the same image hash to the same value regardless of file encoding and metadata.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of analysis results stored in Redis, keyed by the hash of the analyzed image and by the version
+    of the analysis (by default, the fingerprint of its configuration, see analysis_config.py), so that
+    results computed with another configuration are not served. Entries expire after ttl seconds, and at
+    most max_entries entries are kept: the oldest ones are evicted first. Hit and miss counts are kept in
+    Redis as well, so that they are shared by the API and the Celery workers.
+    Redis errors are never raised to the caller: a failed lookup counts as a miss and a failed store is dropped.
+    """
+
+    def __init__(self, client, ttl=cache_ttl, max_entries=cache_max_entries, prefix="result_cache",
+                 version=None):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.version = analysis_config.fingerprint() if version is None else version
+
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def member_(self, image_key: str) -> str:
+        # member of the index of entries, by insertion time
+        return f"{self.version}:{image_key}"
+
+    def key_(self, member: str) -> str:
+        return f"{self.prefix}:entry:{member}"
+
+    def prune_(self, pipe) -> None:
+        # entries expired by their ttl are removed from the index
+        pipe.zremrangebyscore(f"{self.prefix}:index", "-inf", time.time() - self.ttl)
+
+    def get(self, image_key: str):
+        """
+        Returns the cached result for image_key, or None on a miss.
+        """
+        if not self.enabled():
+            return None
+
+        try:
+            value = self.client.get(self.key_(self.member_(image_key)))
+            self.client.incr(f"{self.prefix}:{'hits' if value is not None else 'misses'}")
+        except redis.RedisError as e:
+            print("Result cache lookup failed: " + str(e))
+            return None
+
+        return json.loads(value) if value is not None else None
+
+    def set(self, image_key: str, result: dict) -> None:
+        """
+        Stores result for image_key, evicting the oldest entries if the cache exceeds max_entries.
+        """
+        if not self.enabled():
+            return
+
+        index_key = f"{self.prefix}:index"
+
+        try:
+            member = self.member_(image_key)
+            pipe = self.client.pipeline()
+            pipe.set(self.key_(member), json.dumps(result), ex=self.ttl)
+            self.prune_(pipe)
+            pipe.zadd(index_key, {member: time.time()})
+            pipe.zcard(index_key)
+            n_entries = pipe.execute()[-1]
+
+            if n_entries > self.max_entries:
+                evicted = self.client.zpopmin(index_key, n_entries - self.max_entries)
+                if evicted:
+                    self.client.delete(*[self.key_(member.decode() if isinstance(member, bytes) else member)
+                                         for member, _ in evicted])
+        except redis.RedisError as e:
+            print("Result cache store failed: " + str(e))
+
+    def stats(self) -> dict:
+        """
+        Returns hit and miss counts of the cache, together with its number of entries (including the
+        ones of other versions of the analysis, until they expire).
+        """
+        try:
+            pipe = self.client.pipeline()
+            self.prune_(pipe)
+            _, hits, misses, n_entries = (pipe
+                                          .get(f"{self.prefix}:hits")
+                                          .get(f"{self.prefix}:misses")
+                                          .zcard(f"{self.prefix}:index")
+                                          .execute())
+        except redis.RedisError as e:
+            return {"error": str(e)}
+
+        hits, misses = int(hits or 0), int(misses or 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses > 0 else 0.0,
+            "entries": n_entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "version": self.version,
+        }
+
+
+result_cache = ResultCache(redis.Redis.from_url(cache_url))
@@ -0,0 +1,116 @@
+# result_notifier.py
+import asyncio
+import json
+import os
+import redis
+import redis.asyncio
+
+notifier_url = os.environ.get("RESULT_NOTIFIER_URL", os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0"))
+channel_prefix = "task_done"
+
+
+def task_response(state: str, value) -> dict:
+    """
+    Returns the response describing a task in the given state, where value is the result
+    of a successful task or the exception (or message) of a failed one.
+    """
+    if state == "SUCCESS":
+        return {"state": state, "result": value}
+    elif state == "FAILURE":
+        return {"state": state, "status": str(value)}
+    elif state == "PENDING":
+        return {"state": state, "status": "Task pending..."}
+    elif state == "STARTED":
+        return {"state": state, "status": "Task in progress..."}
+    return {"state": state, "status": "Unknown state"}
+
+
+def publish(client, task_id: str, state: str, value) -> None:
+    """
+    Publishes the completion of task task_id to its channel. Called by workers once the
+    result has been stored in the result backend.
+    """
+    try:
+        client.publish(f"{channel_prefix}:{task_id}", json.dumps(task_response(state, value)))
+    except (redis.RedisError, TypeError) as e:
+        print("Unable to publish completion of task " + task_id + ": " + str(e))
+
+
+class ResultNotifier:
+    """
+    Delivers task completions published by the workers to the clients waiting for them.
+    A single Redis connection, pattern-subscribed to the completion channels of all tasks,
+    is shared by every waiting client: each client only holds an asyncio future, resolved
+    by the listener when the completion of its task is published.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.waiters_ = {}
+        self.listener_ = None
+        self.subscribed_ = asyncio.Event()
+
+    def ensure_started_(self) -> None:
+        if self.listener_ is None or self.listener_.done():
+            self.subscribed_.clear()
+            self.listener_ = asyncio.get_running_loop().create_task(self.listen_())
+
+    async def listen_(self) -> None:
+        while True:
+            try:
+                pubsub = self.client.pubsub()
+                await pubsub.psubscribe(f"{channel_prefix}:*")
+
+                async for message in pubsub.listen():
+                    if message["type"] == "psubscribe":
+                        # completions are only received from now on
+                        self.subscribed_.set()
+                    if message["type"] != "pmessage":
+                        continue
+
+                    channel = message["channel"]
+                    channel = channel.decode() if isinstance(channel, bytes) else channel
+                    task_id = channel[len(channel_prefix) + 1:]
+
+                    for future in self.waiters_.pop(task_id, []):
+                        if not future.done():
+                            future.set_result(json.loads(message["data"]))
+            except redis.RedisError as e:
+                self.subscribed_.clear()
+                print("Result notifier disconnected, reconnecting: " + str(e))
+                await asyncio.sleep(1)
+
+    def subscribe(self, task_id: str) -> asyncio.Future:
+        """
+        Returns a future resolved with the response of task task_id when it completes, if its
+        completion is published once the notifier is subscribed (see method wait_subscribed).
+        Completions can still be missed, e.g. while the notifier reconnects or when a worker
+        fails to publish: waiting clients must check the state of the task on timeout.
+        """
+        self.ensure_started_()
+        future = asyncio.get_running_loop().create_future()
+        self.waiters_.setdefault(task_id, []).append(future)
+        return future
+
+    async def wait_subscribed(self, timeout: float) -> bool:
+        """
+        Waits at most timeout seconds for the notifier to be subscribed to the completion
+        channels, and returns whether it is. Checking the state of a task once subscribed
+        guarantees that its completion is either seen by the check or received later.
+        """
+        self.ensure_started_()
+        try:
+            await asyncio.wait_for(self.subscribed_.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def unsubscribe(self, task_id: str, future: asyncio.Future) -> None:
+        futures = self.waiters_.get(task_id, [])
+        if future in futures:
+            futures.remove(future)
+        if not futures:
+            self.waiters_.pop(task_id, None)
+
+    def n_waiters(self) -> int:
+        return sum(len(futures) for futures in self.waiters_.values())
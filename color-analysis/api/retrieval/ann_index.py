@@ -0,0 +1,248 @@
+import numpy as np
+
+
+def kmeans_(data, n_clusters, n_iter=20, seed=99):
+    """
+    .. description::
+    Lloyd's k-means on the rows of data (numpy array of shape (n, d)), initialized with n_clusters rows sampled
+    at random. Stops early when assignments don't change between two iterations. Empty clusters keep their
+    previous centroid.
+
+    .. outputs::
+    Returns a numpy array of shape (n_clusters, d) containing the centroids.
+    """
+    n, d = data.shape
+    n_clusters = min(n_clusters, n)
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(n, n_clusters, replace=False)].astype(np.float32)
+    squared_norms = (data ** 2).sum(axis=1)
+    assignments = None
+
+    for _ in range(n_iter):
+        distances = squared_norms[:, None] - 2 * data @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+        new_assignments = distances.argmin(axis=1)
+
+        if assignments is not None and np.array_equal(assignments, new_assignments):
+            break
+
+        assignments = new_assignments
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.zeros((n_clusters, d), dtype=np.float64)
+        np.add.at(sums, assignments, data)
+        non_empty = counts > 0
+        centroids[non_empty] = (sums[non_empty] / counts[non_empty, None]).astype(np.float32)
+
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    .. description::
+    Approximate nearest neighbour index for L2-normalized embeddings, ranking by inner product (cosine similarity).
+    Embeddings are partitioned among n_lists inverted lists by a coarse k-means quantizer, and the residual of each
+    embedding with respect to its list centroid is compressed by a product quantizer, splitting it into
+    n_subvectors sub-vectors each encoded on one byte. A query only visits the n_probe lists whose centroids are
+    closest to it, and approximate scores are computed from a lookup table of sub-vector scores, which doesn't
+    depend on the list since scores are inner products. Optionally, the best candidates are re-ranked with the
+    exact embeddings to increase recall.
+    """
+
+    def __init__(self, n_lists=256, n_subvectors=16, n_bits=8):
+        """
+        .. inputs::
+        n_lists:        number of inverted lists (clusters of the coarse quantizer).
+        n_subvectors:   number of sub-vectors of the product quantizer; must divide the embedding dimension.
+        n_bits:         bits used to encode each sub-vector (at most 8).
+        """
+        assert(0 < n_bits <= 8)
+
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.n_bits = n_bits
+        self.centroids = None
+        self.codebooks = None
+        self.codes = np.zeros((0, n_subvectors), dtype=np.uint8)
+        self.ids = np.zeros((0,), dtype=np.int64)
+        self.list_offsets = np.zeros((n_lists + 1,), dtype=np.int64)
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def is_trained(self):
+        return self.centroids is not None
+
+    def split_(self, vectors):
+        """
+        .. description::
+        Reshapes vectors of shape (n, d) into sub-vectors of shape (n_subvectors, n, d / n_subvectors).
+        """
+        n, d = vectors.shape
+        return vectors.reshape((n, self.n_subvectors, d // self.n_subvectors)).swapaxes(0, 1)
+
+    def assign_(self, vectors):
+        """
+        .. description::
+        Returns the index of the inverted list of each vector, i.e. the closest centroid of the coarse quantizer.
+        """
+        distances = (self.centroids ** 2).sum(axis=1)[None, :] - 2 * vectors @ self.centroids.T
+        return distances.argmin(axis=1)
+
+    def encode_(self, vectors, lists):
+        """
+        .. description::
+        Encodes the residuals of vectors with respect to the centroids of lists with the product quantizer.
+        Returns a numpy array of shape (n, n_subvectors) of codes.
+        """
+        residuals = self.split_(vectors - self.centroids[lists])
+        codes = np.zeros((vectors.shape[0], self.n_subvectors), dtype=np.uint8)
+
+        for m in range(self.n_subvectors):
+            codebook = self.codebooks[m]
+            distances = (codebook ** 2).sum(axis=1)[None, :] - 2 * residuals[m] @ codebook.T
+            codes[:, m] = distances.argmin(axis=1)
+
+        return codes
+
+    def train(self, embeddings, max_training_points=65536, seed=99):
+        """
+        .. description::
+        Trains coarse quantizer and product quantizer on (a random sample of) embeddings, a numpy array
+        of shape (n, d). Returns the index itself.
+        """
+        n, d = embeddings.shape
+        assert(d % self.n_subvectors == 0)
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, min(n, max_training_points), replace=False))
+        training_points = np.asarray(embeddings[sample], dtype=np.float32)
+
+        self.centroids = kmeans_(training_points, self.n_lists, seed=seed)
+        self.n_lists = self.centroids.shape[0]
+        self.list_offsets = np.zeros((self.n_lists + 1,), dtype=np.int64)
+
+        residuals = self.split_(training_points - self.centroids[self.assign_(training_points)])
+        self.codebooks = np.stack([
+            kmeans_(residuals[m], 2 ** self.n_bits, seed=seed) for m in range(self.n_subvectors) ])
+
+        return self
+
+    def add(self, embeddings, ids=None, batch_size=65536):
+        """
+        .. description::
+        Adds embeddings (numpy array of shape (n, d)) to the index, identified by ids (numpy array of shape (n,));
+        if ids is None, embeddings are identified by consecutive ids following the ones already in the index.
+        Returns the index itself.
+        """
+        assert(self.is_trained())
+
+        n = embeddings.shape[0]
+        if ids is None:
+            first_id = 0 if len(self) == 0 else int(self.ids.max()) + 1
+            ids = np.arange(first_id, first_id + n, dtype=np.int64)
+
+        lists = []
+        codes = []
+
+        for start in range(0, n, batch_size):
+            batch = np.asarray(embeddings[start:start + batch_size], dtype=np.float32)
+            batch_lists = self.assign_(batch)
+            lists.append(batch_lists)
+            codes.append(self.encode_(batch, batch_lists))
+
+        old_lists = np.repeat(np.arange(self.n_lists), np.diff(self.list_offsets))
+        all_lists = np.concatenate([old_lists] + lists)
+        all_codes = np.concatenate([self.codes] + codes)
+        all_ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+
+        # keeping inverted lists contiguous, so that each one is a slice of codes and ids
+        order = np.argsort(all_lists, kind='stable')
+        self.codes = all_codes[order]
+        self.ids = all_ids[order]
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(all_lists, minlength=self.n_lists))])
+
+        return self
+
+    def search(self, query, k=5, n_probe=8, rerank=0, embeddings=None):
+        """
+        .. description::
+        Retrieves the k embeddings of the index with highest (approximate) inner product with query, a numpy array
+        of shape (d,) or (1, d).
+
+        .. inputs::
+        n_probe:        number of inverted lists visited; higher values increase recall and latency.
+        rerank:         number of best candidates whose score is recomputed exactly using embeddings, the array of
+                        all embeddings indexed by id (e.g. a memory-mapped array); 0 to disable re-ranking.
+                        Values greater than k increase recall.
+
+        .. outputs::
+        Returns a tuple (ids, scores) of numpy arrays, sorted by decreasing score.
+        """
+        assert(self.is_trained())
+        assert(rerank == 0 or embeddings is not None)
+
+        query = np.asarray(query, dtype=np.float32).reshape((-1,))
+        n_probe = min(n_probe, self.n_lists)
+
+        coarse_scores = self.centroids @ query
+        probed_lists = np.argpartition(-coarse_scores, n_probe - 1)[:n_probe]
+        # lookup_table[m, j] is the score between the m-th sub-vector of query and the j-th code of codebook m
+        lookup_table = np.einsum('mjd,md->mj', self.codebooks, self.split_(query[None, :])[:, 0, :])
+
+        candidate_ids = []
+        candidate_scores = []
+
+        for list_idx in probed_lists:
+            start, end = self.list_offsets[list_idx], self.list_offsets[list_idx + 1]
+            if start == end:
+                continue
+
+            list_codes = self.codes[start:end]
+            residual_scores = lookup_table[np.arange(self.n_subvectors), list_codes].sum(axis=1)
+            candidate_ids.append(self.ids[start:end])
+            candidate_scores.append(coarse_scores[list_idx] + residual_scores)
+
+        if len(candidate_ids) == 0:
+            return np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.float32)
+
+        candidate_ids = np.concatenate(candidate_ids)
+        candidate_scores = np.concatenate(candidate_scores)
+
+        n_candidates = max(k, rerank)
+        if n_candidates < candidate_ids.shape[0]:
+            top = np.argpartition(-candidate_scores, n_candidates - 1)[:n_candidates]
+            candidate_ids, candidate_scores = candidate_ids[top], candidate_scores[top]
+
+        if rerank > 0:
+            order = np.argsort(candidate_ids)
+            candidate_ids = candidate_ids[order]
+            candidate_scores = np.asarray(embeddings[candidate_ids], dtype=np.float32) @ query
+
+        order = np.argsort(-candidate_scores, kind='stable')[:k]
+        return candidate_ids[order], candidate_scores[order]
+
+    def save(self, filename):
+        """
+        .. description::
+        Saves the index as a .npz file.
+        """
+        assert(self.is_trained())
+
+        np.savez(filename, centroids=self.centroids, codebooks=self.codebooks, codes=self.codes, ids=self.ids,
+                 list_offsets=self.list_offsets, n_bits=self.n_bits)
+
+    def load(self, filename):
+        """
+        .. description::
+        Loads an index saved with method save. Returns the index itself.
+        """
+        with np.load(filename) as data:
+            self.centroids = data['centroids']
+            self.codebooks = data['codebooks']
+            self.codes = data['codes']
+            self.ids = data['ids']
+            self.list_offsets = data['list_offsets']
+            self.n_bits = int(data['n_bits'])
+
+        self.n_lists = self.centroids.shape[0]
+        self.n_subvectors = self.codebooks.shape[0]
+        return self
@@ -0,0 +1,269 @@
+# --- Needed to import modules from other packages
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+# ---
+
+import os
+import json
+import time
+import math
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+from tqdm import tqdm
+from retrieval import ann_index
+
+
+EMBEDDINGS_FILENAME = 'embeddings.npy'
+METADATA_FILENAME = 'metadata.json'
+ANN_FILENAME = 'ann.npz'
+
+
+def cloth_path_from_sample_(dataroot, cloth_name):
+    """
+    .. description::
+    Returns the path of a clothing image of DressCode Dataset, built in the same way as the paths returned by
+    function retrieval.training_and_testing_retrieval.retrieve_clothes.
+    """
+    return dataroot + '/images/' + cloth_name
+
+
+def top_k_(scores, k):
+    """
+    .. description::
+    Returns the indexes of the k highest values of scores (numpy array of shape (n,)), sorted by decreasing
+    value. If k is -1 or greater than n, all indexes are returned.
+    """
+    n = scores.shape[0]
+
+    if k == -1 or k >= n:
+        return np.argsort(-scores, kind='stable')
+
+    top_indexes = np.argpartition(-scores, k - 1)[:k]
+    return top_indexes[np.argsort(-scores[top_indexes], kind='stable')]
+
+
+class ClothEmbeddingIndex:
+    """
+    .. description::
+    Index of precomputed CLIP image embeddings for the clothing images of a DressCode dataset. Embeddings are
+    L2-normalized and stored on disk as a float32 numpy array of shape (n_images, embedding_dim), which is
+    memory-mapped when the index is loaded; paths and categories of the indexed images are stored alongside
+    as a JSON file. Once built, retrieving the images matching a query requires a single matrix-vector product
+    between the embeddings and the (normalized) text features of the query, followed by top-k selection.
+    The index can be updated incrementally: only images not already indexed are encoded.
+    For large catalogs, an approximate nearest neighbour index (see retrieval.ann_index.IVFPQIndex) can be built
+    on top of the embeddings and used for top-k queries; it is persisted in the same directory and kept up to
+    date when new images are indexed.
+    """
+
+    def __init__(self, index_path):
+        """
+        .. inputs::
+        index_path: directory in which embeddings and metadata of the index are stored.
+        """
+
+        self.index_path = index_path
+        self.embeddings_ = None
+        self.paths_ = []
+        self.categories_ = []
+        self.ann_ = None
+
+    def embeddings_filename(self):
+        return os.path.join(self.index_path, EMBEDDINGS_FILENAME)
+
+    def metadata_filename(self):
+        return os.path.join(self.index_path, METADATA_FILENAME)
+
+    def ann_filename(self):
+        return os.path.join(self.index_path, ANN_FILENAME)
+
+    def has_ann(self):
+        return self.ann_ is not None
+
+    def exists(self):
+        return os.path.isfile(self.embeddings_filename()) and os.path.isfile(self.metadata_filename())
+
+    def __len__(self):
+        return len(self.paths_)
+
+    def embeddings(self):
+        """
+        .. description::
+        Returns the (memory-mapped) numpy array of shape (n_images, embedding_dim) containing the embeddings.
+        """
+        return self.embeddings_
+
+    def paths(self):
+        return self.paths_
+
+    def categories(self):
+        return self.categories_
+
+    def load(self):
+        """
+        .. description::
+        Loads the index from disk, memory-mapping the embeddings file. Returns the index itself.
+        """
+        assert(self.exists())
+
+        with open(self.metadata_filename()) as metadata_file:
+            metadata = json.load(metadata_file)
+
+        self.paths_ = metadata['paths']
+        self.categories_ = metadata['categories']
+        self.embeddings_ = np.load(self.embeddings_filename(), mmap_mode='r')
+        assert(self.embeddings_.shape[0] == len(self.paths_))
+
+        if os.path.isfile(self.ann_filename()):
+            self.ann_ = ann_index.IVFPQIndex().load(self.ann_filename())
+
+        return self
+
+    def build_ann(self, n_lists=256, n_subvectors=16, n_bits=8):
+        """
+        .. description::
+        Trains an approximate nearest neighbour index on the embeddings of the index, adds all embeddings to it
+        and saves it to disk. Returns the index itself.
+
+        .. inputs::
+        n_lists, n_subvectors, n_bits:  parameters of retrieval.ann_index.IVFPQIndex.
+        """
+        assert(self.embeddings_ is not None)
+
+        self.ann_ = ann_index.IVFPQIndex(n_lists, n_subvectors, n_bits).train(self.embeddings_)
+        self.ann_.add(self.embeddings_)
+        self.ann_.save(self.ann_filename())
+        return self
+
+    def build(self, device, model, dataset, batch_size=32, num_workers=0, verbose=False):
+        """
+        .. description::
+        Encodes with model all images of dataset (DressCode dataset object) which are not already part of the index
+        and stores the resulting embeddings on disk, together with the ones already computed. If the index exists
+        on disk, it is loaded first, so that building the index again after adding images to the dataset only
+        encodes the new images. Returns the index itself, with the embeddings memory-mapped.
+
+        .. inputs::
+        device:     cpu or cuda.
+        model:      CLIP model to use.
+        """
+
+        if self.embeddings_ is None and self.exists():
+            self.load()
+
+        indexed_paths = set(self.paths_)
+        new_indexes = [
+            idx for idx in range(len(dataset))
+            if cloth_path_from_sample_(dataset.dataroot_names[idx], dataset.cloth_names[idx]) not in indexed_paths ]
+
+        if len(new_indexes) == 0:
+            return self
+
+        model = model.to(device)
+        model.eval()
+
+        dl = DataLoader(Subset(dataset, new_indexes), batch_size=batch_size, shuffle=False, drop_last=False,
+                        num_workers=num_workers)
+        new_embeddings = []
+        new_paths = []
+        new_categories = []
+
+        clock_start = time.time()
+
+        with torch.no_grad():
+            for inputs in tqdm(dl, disable=not verbose):
+                dataroot = inputs['dataroot']
+                cloth_name = inputs['cloth_name']
+                cloth_img = inputs['cloth_img'].to(device)
+
+                image_features = model.encode_image(cloth_img)
+                image_features /= image_features.norm(dim=-1, keepdim=True)
+                new_embeddings.append(image_features.to('cpu').numpy().astype(np.float32))
+
+                for idx in range(len(cloth_name)):
+                    new_paths.append(cloth_path_from_sample_(dataroot[idx], cloth_name[idx]))
+                    new_categories.append(dataroot[idx].split('/')[-1])
+
+        clock_end = time.time()
+
+        if verbose:
+            print(f'Device: {device}.')
+            print(f'Encoded {len(new_paths)} new images in around {math.ceil(clock_end - clock_start)} seconds.')
+
+        new_embeddings = np.concatenate(new_embeddings, axis=0)
+        n_old = len(self.paths_)
+        self.save_(new_embeddings, new_paths, new_categories)
+
+        if self.ann_ is not None:
+            new_ids = np.arange(n_old, n_old + new_embeddings.shape[0], dtype=np.int64)
+            self.ann_.add(new_embeddings, new_ids)
+            self.ann_.save(self.ann_filename())
+
+        return self.load()
+
+    def save_(self, new_embeddings, new_paths, new_categories):
+        """
+        .. description::
+        Writes to disk the embeddings of the index followed by new_embeddings (numpy array of shape
+        (n_new_images, embedding_dim)), and updates metadata accordingly. Files are first written to temporary
+        files and then moved in place, so that a reader never sees a partially written index.
+        """
+
+        os.makedirs(self.index_path, exist_ok=True)
+        n_old = 0 if self.embeddings_ is None else self.embeddings_.shape[0]
+        n_images = n_old + new_embeddings.shape[0]
+        embedding_dim = new_embeddings.shape[1]
+
+        tmp_embeddings_filename = self.embeddings_filename() + '.tmp'
+        embeddings = np.lib.format.open_memmap(
+            tmp_embeddings_filename, mode='w+', dtype=np.float32, shape=(n_images, embedding_dim))
+
+        if n_old > 0:
+            assert(self.embeddings_.shape[1] == embedding_dim)
+            embeddings[:n_old] = self.embeddings_
+
+        embeddings[n_old:] = new_embeddings
+        embeddings.flush()
+        del embeddings
+
+        tmp_metadata_filename = self.metadata_filename() + '.tmp'
+        with open(tmp_metadata_filename, 'w') as metadata_file:
+            json.dump({
+                'paths': self.paths_ + new_paths,
+                'categories': self.categories_ + new_categories,
+            }, metadata_file)
+
+        self.embeddings_ = None
+        os.replace(tmp_embeddings_filename, self.embeddings_filename())
+        os.replace(tmp_metadata_filename, self.metadata_filename())
+
+    def search(self, text_features, k=5, n_probe=None, rerank=0):
+        """
+        .. description::
+        Retrieves the k indexed images closest to the query described by text_features, a pytorch tensor of
+        shape (1, embedding_dim) or (embedding_dim,) containing the L2-normalized text features of the query.
+        If n_probe is not None, the search is approximate and uses the approximate nearest neighbour index,
+        visiting n_probe of its inverted lists and re-ranking the best rerank candidates with exact scores;
+        otherwise, the search is exact.
+
+        .. outputs::
+        Returns a tuple (paths, scores), where paths is the list of paths of the retrieved images and scores is
+        a numpy array containing their cosine similarity with the query, both sorted by decreasing score.
+        If k is -1, all indexed images are returned.
+        """
+        assert(self.embeddings_ is not None)
+
+        query = text_features.reshape((-1,)).to('cpu').numpy().astype(np.float32)
+
+        if n_probe is not None:
+            assert(self.has_ann() and k != -1)
+
+            top_indexes, scores = self.ann_.search(query, k, n_probe, rerank, self.embeddings_)
+            return [ self.paths_[idx] for idx in top_indexes ], scores
+
+        scores = self.embeddings_ @ query
+        top_indexes = top_k_(scores, k)
+
+        return [ self.paths_[idx] for idx in top_indexes ], scores[top_indexes]
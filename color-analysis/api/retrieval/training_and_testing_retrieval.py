@@ -2,7 +2,6 @@ import torch
 from torch.utils.data import DataLoader
 import time
 import math
-import queue
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 from PIL import Image
@@ -73,10 +72,94 @@ def test_retrieval_model(device, model, tokenizer, dataset, batch_size, num_work
     return image_text_accuracy, text_image_accuracy
 
 
+def compute_query_features(device, model, tokenizer, query):
+    """
+    .. description::
+    Function that encodes a query string with the text encoder of a CLIP model.
+
+    .. inputs::
+    device:                     cpu or cuda.
+    model:                      CLIP model to use.
+    tokenizer:                  tokenizer relative to CLIP model that process the query strings.
+    query:                      class to search in the dataset (dresses | upper_body | lower_body).
+
+    .. outputs::
+    Returns a pytorch tensor of shape (1, embedding_dim) containing the L2-normalized text features of the query.
+    """
+
+    model = model.to(device)
+    model.eval()
+
+    label = "a cloth of type " + query.replace("_", " ")
+    text = tokenizer(label).to(device)
+
+    with torch.no_grad():
+        text_features = model.encode_text(text)
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+
+    return text_features
+
+
+class StreamingTopK:
+    """
+    .. description::
+    Accumulator keeping the k highest scores (and corresponding indexes) seen across a stream of batches.
+    Each batch is reduced with torch.topk and merged into a running buffer of at most k elements, so that
+    memory doesn't grow with the number of batches. If k is -1, all scores are kept (as pytorch tensors)
+    and sorted once at the end.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.scores = torch.zeros((0,))
+        self.indexes = torch.zeros((0,), dtype=torch.int64)
+        self.scores_chunks = []
+        self.indexes_chunks = []
+
+    def update(self, scores, indexes):
+        """
+        .. description::
+        Merges a batch of scores and indexes (pytorch tensors of shape (batch_size,)) into the buffer.
+        """
+        scores = scores.to('cpu')
+        indexes = indexes.to('cpu')
+
+        if self.k == -1:
+            self.scores_chunks.append(scores)
+            self.indexes_chunks.append(indexes)
+            return
+
+        if scores.shape[0] > self.k:
+            scores, top = torch.topk(scores, self.k)
+            indexes = indexes[top]
+
+        merged_scores = torch.cat([self.scores, scores])
+        merged_indexes = torch.cat([self.indexes, indexes])
+        n_kept = min(self.k, merged_scores.shape[0])
+        self.scores, top = torch.topk(merged_scores, n_kept)
+        self.indexes = merged_indexes[top]
+
+    def result(self):
+        """
+        .. description::
+        Returns a tuple (scores, indexes) of pytorch tensors, sorted by decreasing score.
+        """
+        if self.k == -1 and len(self.scores_chunks) > 0:
+            self.scores = torch.cat([self.scores] + self.scores_chunks)
+            self.indexes = torch.cat([self.indexes] + self.indexes_chunks)
+            self.scores_chunks = []
+            self.indexes_chunks = []
+
+        self.scores, order = torch.sort(self.scores, descending=True, stable=True)
+        self.indexes = self.indexes[order]
+        return self.scores, self.indexes
+
+
 def retrieve_clothes(device, model, tokenizer, query, dataset, k=5, batch_size=32, save_img_path=None, num_workers=0, verbose=False):
     """
     .. description::
-    Function that retrieves images from a dataset given a query string.
+    Function that retrieves images from a dataset given a query string. The query is encoded once, images are
+    ranked by cosine similarity with the query and the best k are kept with a streaming top-k accumulator.
 
     .. inputs::
     device:                     cpu or cuda.
@@ -84,43 +167,35 @@ def retrieve_clothes(device, model, tokenizer, query, dataset, k=5, batch_size=3
     tokenizer:                  tokenizer relative to CLIP model that process the query strings.
     query:                      class to search in the dataset (dresses | upper_body | lower_body).
     dataset:                    DressCode dataset object.
-    k:                          how many images to retrieve.
+    k:                          how many images to retrieve (-1 to rank all images).
     save_img_path:              path to save the images retrieved with their scores, default is None.
 
     .. outputs::
-    Returns a list of paths of the retrieved images.
+    Returns a list of paths of the retrieved images, sorted by decreasing score.
     If save_img_path is not none the retrieved images are saved with their scores.
     """
     
     model = model.to(device)
     model.eval()
     
-    label = "a cloth of type " + query.replace("_", " ")
-    
-    dl = DataLoader(dataset, batch_size=batch_size, shuffle=True, drop_last=False, num_workers=num_workers)
-    text = tokenizer(label).to(device)
-    pq = queue.PriorityQueue()
+    text_features = compute_query_features(device, model, tokenizer, query)
+    dl = DataLoader(dataset, batch_size=batch_size, shuffle=False, drop_last=False, num_workers=num_workers)
+    top_k = StreamingTopK(k)
     
     clock_start = time.time()
     
     with torch.no_grad():
-        for inputs in tqdm(dl):
-            dataroot = inputs["dataroot"]
-            cloth_name = inputs["cloth_name"]
+        offset = 0
+        for inputs in tqdm(dl, disable=not verbose):
             cloth_img = inputs["cloth_img"].to(device)
 
             image_features = model.encode_image(cloth_img)
-            text_features = model.encode_text(text)
-
             image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
 
-            image_probs = (100.0 * text_features @ image_features.T).softmax(dim=-1)
-            for idx, score in enumerate(image_probs[0, :]):
-                score *= -1
-                img_path = dataroot[idx] + "/images/" + cloth_name[idx]
-                item = (score, img_path)
-                pq.put(item)
+            scores = (text_features @ image_features.T)[0]
+            indexes = torch.arange(offset, offset + scores.shape[0])
+            top_k.update(scores, indexes)
+            offset += scores.shape[0]
     
     clock_end = time.time()
     
@@ -128,20 +203,16 @@ def retrieve_clothes(device, model, tokenizer, query, dataset, k=5, batch_size=3
         print(f'Device: {device}.')
         print(f'Retrieve process completed in around {math.ceil(clock_end - clock_start)} seconds.')
     
-    retrieved_img_paths = []
-    i = 0
-    while not pq.empty():
-        if i == k:
-            break
-        score, img_path = pq.get()
-        retrieved_img_paths.append(img_path)
-        if save_img_path is not None:
-            score *= -1
+    scores, indexes = top_k.result()
+    retrieved_img_paths = [
+        dataset.dataroot_names[idx] + "/images/" + dataset.cloth_names[idx] for idx in indexes.tolist() ]
+
+    if save_img_path is not None:
+        for i, (score, img_path) in enumerate(zip(scores, retrieved_img_paths)):
             img = Image.open(img_path)
             plt.figure()
-            plt.title(f"Score: {100 * score.item()}%")
+            plt.title(f"Score: {score.item():.4f}")
             plt.imshow(img)
             plt.savefig(save_img_path + f"image_{i + 1}_{query}.png")
-        i += 1
     
     return retrieved_img_paths
@@ -0,0 +1,109 @@
+# task_metrics.py
+import os
+import redis
+
+metrics_url = os.environ.get("TASK_METRICS_URL", os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0"))
+# upper bounds in seconds of the buckets of the histograms of stage durations
+duration_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_bound_(bound: float) -> str:
+    return repr(float(bound))
+
+
+class TaskMetrics:
+    """
+    Prometheus-style metrics of the analysis tasks: a counter of tasks by outcome and, for each
+    stage of the analysis (see the timings returned by process_image_task), a histogram of its
+    wall time and a counter of its cpu time. Observations are aggregated in Redis, so that the
+    ones of all worker processes add up, and rendered by the API in the Prometheus text format.
+    Redis errors are never raised to the caller: a failed observation is dropped.
+    """
+
+    def __init__(self, client, buckets=duration_buckets, prefix="task_metrics"):
+        self.client = client
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+
+    def observe(self, status: str, timings: dict) -> None:
+        """
+        Records a task with outcome status (e.g. 'success', 'cached' or 'error') and the timings
+        of its stages, a dictionary mapping each stage to its wall_ms and cpu_ms.
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hincrby(f"{self.prefix}:tasks", status, 1)
+
+            for stage, timing in timings.items():
+                wall_time = timing["wall_ms"] / 1000
+                pipe.hincrby(f"{self.prefix}:count", stage, 1)
+                pipe.hincrbyfloat(f"{self.prefix}:wall_sum", stage, wall_time)
+                pipe.hincrbyfloat(f"{self.prefix}:cpu_sum", stage, timing["cpu_ms"] / 1000)
+                # buckets are cumulative, as in Prometheus: each one counts the observations up to its bound
+                for bound in self.buckets:
+                    if wall_time <= bound:
+                        pipe.hincrby(f"{self.prefix}:buckets", f"{stage}:{format_bound_(bound)}", 1)
+
+            pipe.execute()
+        except redis.RedisError as e:
+            print("Task metrics update failed: " + str(e))
+
+    def render(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format. If Redis can't be
+        reached, only the color_analysis_task_metrics_up gauge is returned, set to 0.
+        """
+        up_lines = [
+            "# HELP color_analysis_task_metrics_up Whether the task metrics could be read from Redis.",
+            "# TYPE color_analysis_task_metrics_up gauge",
+        ]
+
+        try:
+            tasks, counts, wall_sums, cpu_sums, buckets = (self.client.pipeline()
+                                                           .hgetall(f"{self.prefix}:tasks")
+                                                           .hgetall(f"{self.prefix}:count")
+                                                           .hgetall(f"{self.prefix}:wall_sum")
+                                                           .hgetall(f"{self.prefix}:cpu_sum")
+                                                           .hgetall(f"{self.prefix}:buckets")
+                                                           .execute())
+        except redis.RedisError as e:
+            print("Task metrics read failed: " + str(e))
+            return "\n".join(up_lines + ["color_analysis_task_metrics_up 0"]) + "\n"
+
+        tasks, counts, wall_sums, cpu_sums, buckets = [
+            { (key.decode() if isinstance(key, bytes) else key): float(value) for key, value in hash_.items() }
+            for hash_ in (tasks, counts, wall_sums, cpu_sums, buckets)
+        ]
+
+        lines = up_lines + [
+            "color_analysis_task_metrics_up 1",
+            "# HELP color_analysis_tasks_total Analysis tasks processed by the workers, by outcome.",
+            "# TYPE color_analysis_tasks_total counter",
+        ]
+        for status, n_tasks in sorted(tasks.items()):
+            lines.append(f'color_analysis_tasks_total{{status="{status}"}} {n_tasks:g}')
+
+        lines += [
+            "# HELP color_analysis_stage_duration_seconds Wall time of the stages of analysis tasks.",
+            "# TYPE color_analysis_stage_duration_seconds histogram",
+        ]
+        for stage in sorted(counts):
+            for bound in self.buckets:
+                n_observations = buckets.get(f"{stage}:{format_bound_(bound)}", 0)
+                lines.append(f'color_analysis_stage_duration_seconds_bucket{{stage="{stage}",le="{format_bound_(bound)}"}} '
+                             f'{n_observations:g}')
+            lines.append(f'color_analysis_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {counts[stage]:g}')
+            lines.append(f'color_analysis_stage_duration_seconds_sum{{stage="{stage}"}} {wall_sums.get(stage, 0)}')
+            lines.append(f'color_analysis_stage_duration_seconds_count{{stage="{stage}"}} {counts[stage]:g}')
+
+        lines += [
+            "# HELP color_analysis_stage_cpu_seconds_total Cpu time of the stages of analysis tasks.",
+            "# TYPE color_analysis_stage_cpu_seconds_total counter",
+        ]
+        for stage in sorted(counts):
+            lines.append(f'color_analysis_stage_cpu_seconds_total{{stage="{stage}"}} {cpu_sums.get(stage, 0)}')
+
+        return "\n".join(lines) + "\n"
+
+
+task_metrics = TaskMetrics(redis.Redis.from_url(metrics_url))
@@ -1,14 +1,24 @@
 # tasks.py
-import io
+import os
 import time
 from PIL import Image
 from celery_app import celery_app
+import result_cache
+import analysis_config
+import blob_store
+import result_notifier
+import task_metrics
+import redis
+import threading
+from celery.signals import task_postrun, worker_process_init
+from image_loading import open_image, resize_image
 
 # Import your analysis function and any dependencies
-from pipeline import pipeline, segmentation_filter
+from pipeline import pipeline, segmentation_filter, face_crop_filter, batch_scheduler, profiling
 from palette_classification import color_processing, palette
 from metrics_and_losses import metrics
 from utils import segmentation_labels, utils
+from models import config
 from collections import OrderedDict
 
 import glob
@@ -20,8 +30,26 @@ import math
 # --- (Initialize global variables as in your original script) ---
 device = "mps:0" if torch.backends.mps.is_available() else "cpu"
 verbose = False
-segmentation_model = "cloud"
+# configuration of the analysis, shared with the API (see analysis_config.py)
+segmentation_model = analysis_config.segmentation_model
+dominants_method = analysis_config.dominants_method
 query = "dress"
+# micro-batching of segmentation: requests handled concurrently by the worker (e.g. started with 
+# --pool threads) are segmented together, in batches of at most max_batch_size images gathered 
+# within max_wait seconds; batching is disabled by default (max_batch_size of 1), since it only
+# adds latency to workers handling a single task at a time, such as the ones of the prefork pool
+segmentation_max_batch_size = int(os.environ.get("SEGMENTATION_MAX_BATCH_SIZE", "1"))
+segmentation_max_wait = float(os.environ.get("SEGMENTATION_MAX_WAIT", "0.01"))
+segmentation_backend = analysis_config.segmentation_backend
+segmentation_n_threads = int(os.environ["SEGMENTATION_N_THREADS"]) if "SEGMENTATION_N_THREADS" in os.environ \
+    else config.SEGMENTATION_N_THREADS
+face_crop = analysis_config.face_crop
+face_crop_decode_size = analysis_config.face_crop_decode_size
+# sampling profiles of slow tasks: when the threshold is greater than 0 seconds, every task is sampled,
+# and the profiles of the ones lasting longer are saved to profile_path, see pipeline/profiling.py
+profile_slow_threshold = float(os.environ.get("PROFILE_SLOW_THRESHOLD", "0"))
+profile_interval = float(os.environ.get("PROFILE_INTERVAL", "0.01"))
+profile_path = os.environ.get("PROFILE_PATH", "profiles/")
 n_plotted_retrieved_clothes = 50
 print("Using device " + device)
 
@@ -43,28 +71,105 @@ for category in ["dresses", "lower_body", "upper_body"]:
     with open(mapping_dict_filename) as mapping_file:
         palette_mappings_dict[category] = json.load(mapping_file)
 
-pl = pipeline.Pipeline()
-sf = segmentation_filter.SegmentationFilter(segmentation_model)
-pl.add_filter(sf)
+# the segmentation model is loaded lazily, only by processes running inference (see load_models)
+pl = None
+fcf = None
+sf = None
+models_lock = threading.Lock()
 
 
-def analyze(image: Image.Image) -> dict["Season": str, "Subtone": str]:
-    img, masks = pl.execute(image, device, verbose)
-    img_segmented = color_processing.colorize_segmentation_masks(masks, segmentation_labels.labels)
+def load_models() -> None:
+    """
+    Builds the segmentation pipeline, loading the weights of the segmentation model,
+    and the face crop filter if enabled (run by process_image_ before the downscale).
+    Called by the first analysis of the process, unless already called when the
+    worker process started.
+    """
+    global pl, fcf, sf
+
+    with models_lock:
+        if pl is not None:
+            return
+
+        sf = segmentation_filter.SegmentationFilter(
+            segmentation_model, output="labels", backend=segmentation_backend, n_threads=segmentation_n_threads)
+        fcf = face_crop_filter.FaceCropFilter() if face_crop else None
+        pipeline_ = pipeline.Pipeline()
+        pipeline_.add_filter(sf, "segmentation")
+        pl = pipeline_  # assigned last, since analyze checks pl without holding the lock
+
+
+segmentation_scheduler_ = None
+segmentation_scheduler_pid_ = None
+segmentation_scheduler_lock = threading.Lock()
+
+
+def get_segmentation_scheduler():
+    """
+    Returns the micro-batch scheduler of segmentation, or None if batching is disabled.
+    The scheduler, and its background thread, are created by the first call of each
+    process: threads aren't carried into the processes forked by the prefork pool, so a
+    scheduler created before the fork would leave the tasks of the children waiting
+    forever for their batch.
+    """
+    global segmentation_scheduler_, segmentation_scheduler_pid_
+
+    if segmentation_max_batch_size <= 1:
+        return None
+
+    with segmentation_scheduler_lock:
+        if segmentation_scheduler_pid_ != os.getpid():
+            segmentation_scheduler_ = batch_scheduler.MicroBatchScheduler(
+                lambda images: sf.execute_batch(images, device, verbose),
+                max_batch_size=segmentation_max_batch_size, max_wait=segmentation_max_wait
+            )
+            segmentation_scheduler_pid_ = os.getpid()
+
+    return segmentation_scheduler_
+
+
+@worker_process_init.connect
+def load_models_on_worker_process_init(**kwargs):
+    """
+    Loads models when a prefork pool process starts, after the fork, so that the
+    first task doesn't pay for it. Other pools load them on the first task.
+    """
+    load_models()
+
+
+def analyze(image: Image.Image, dominants_method: str = dominants_method,
+            timings: dict = None) -> dict["Season": str, "Subtone": str]:
+    """
+    Analyzes the image of a user, returning their season and subtone. If timings is a
+    dictionary, the wall time, cpu time and peak memory of each stage of the analysis are
+    recorded in it (see pipeline/profiling.py).
+    """
+    if pl is None:
+        load_models()
+
+    segmentation_scheduler = get_segmentation_scheduler()
+    if segmentation_scheduler is not None:
+        # includes the time spent waiting for the batch to be gathered
+        with profiling.profile_stage("segmentation", timings):
+            img, label_map = segmentation_scheduler(image)
+    else:
+        img, label_map = pl.execute(image, device, verbose, timings=timings)
 
     labels = OrderedDict({ label: segmentation_labels.labels[label] for label in ['skin', 'hair', 'lips', 'eyes'] })
+    label_indexes = [utils.from_key_to_index(segmentation_labels.labels, label) for label in labels]
 
     skin_idx = utils.from_key_to_index(labels, 'skin')
     hair_idx = utils.from_key_to_index(labels, 'hair')
     lips_idx = utils.from_key_to_index(labels, 'lips')
     eyes_idx = utils.from_key_to_index(labels, 'eyes')
 
-    segmentation_masks = color_processing.compute_segmentation_masks(img_segmented, labels)
-    img_masked = color_processing.apply_masks(img, segmentation_masks)
+    with profiling.profile_stage("mask_extraction", timings):
+        img_masked = color_processing.apply_label_map(img, label_map, label_indexes)
 
-    dominants = color_processing.compute_user_embedding(
-    img_masked, n_candidates=(3, 3, 3, 3), distance_fn=metrics.rmse, debug=False)
-    dominants_palette = palette.PaletteRGB('dominants', dominants)
+    with profiling.profile_stage("dominants_extraction", timings):
+        dominants = color_processing.compute_user_embedding(
+        img_masked, n_candidates=(3, 3, 3, 3), distance_fn=metrics.rmse_color_reconstruction, debug=False, method=dominants_method)
+        dominants_palette = palette.PaletteRGB('dominants', dominants)
 
     # Thresholds
     # I: 0.422, V: 0.390, C: 0.2
@@ -93,50 +198,129 @@ def analyze(image: Image.Image) -> dict["Season": str, "Subtone": str]:
     seasons = [autumn, spring, summer, winter]
 
     thresholds = (0.200, 0.422, 0.390)
-    subtone = palette.compute_subtone(dominants[skin_idx])
-    intensity = palette.compute_intensity(dominants[skin_idx])
-    value = palette.compute_value(dominants[skin_idx], dominants[hair_idx], dominants[eyes_idx])
-    contrast = palette.compute_contrast(dominants[hair_idx], dominants[skin_idx])
-    dominants_palette.compute_metrics_vector(subtone, intensity, value, contrast, thresholds)
-
-    min_sqrt_dist = math.inf
-    season = ''
-    vector = [1 if subtone == 'warm' else 0, intensity, value, contrast]
-    for (vals, desc) in seasons:
-        sqr_dist = sum([(vals[i] - vector[i]) ** 2 for i in range(4)])
-        sqrt_dist = math.sqrt(sqr_dist)
-        if sqrt_dist < min_sqrt_dist:
-            season = desc
-            min_sqrt_dist = sqrt_dist
+    with profiling.profile_stage("metrics", timings):
+        subtone = palette.compute_subtone(dominants[skin_idx])
+        intensity = palette.compute_intensity(dominants[skin_idx])
+        value = palette.compute_value(dominants[skin_idx], dominants[hair_idx], dominants[eyes_idx])
+        contrast = palette.compute_contrast(dominants[hair_idx], dominants[skin_idx])
+        dominants_palette.compute_metrics_vector(subtone, intensity, value, contrast, thresholds)
+
+    with profiling.profile_stage("classification", timings):
+        min_sqrt_dist = math.inf
+        season = ''
+        vector = [1 if subtone == 'warm' else 0, intensity, value, contrast]
+        for (vals, desc) in seasons:
+            sqr_dist = sum([(vals[i] - vector[i]) ** 2 for i in range(4)])
+            sqrt_dist = math.sqrt(sqr_dist)
+            if sqrt_dist < min_sqrt_dist:
+                season = desc
+                min_sqrt_dist = sqrt_dist
 
     return {"Season": season, "Subtone": subtone, "Int": str(intensity), "Val": str(value), "Con": str(contrast), "Mtrx": str(dominants_palette.metrics_vector())}
 
 
-@celery_app.task(name="tasks.process_image_task")
-def process_image_task(file_contents: bytes) -> dict:
+def process_image_(image_ref, image_key: str, timings: dict) -> tuple:
     """
-    Celery task that receives the raw file bytes, processes the image,
-    and returns the analysis result.
+    Body of process_image_task, returning the outcome of the task ('success', 'cached'
+    or 'error') together with its result.
     """
+    # the face crop runs before the downscale, on a larger decoding of the upload
+    decode_size = max(face_crop_decode_size, 300) if face_crop else 300
+    pre_decode = time.time()
     try:
-        image = Image.open(io.BytesIO(file_contents)).convert("RGB")
+        with profiling.profile_stage("decode", timings):
+            if isinstance(image_ref, (bytes, bytearray)):
+                image = open_image(image_ref, decode_size)
+            else:
+                blob = blob_store.blob_store.open(image_ref)
+                try:
+                    image = open_image(blob, decode_size)
+                finally:
+                    if hasattr(blob, "close"):
+                        blob.close()
+                    blob_store.blob_store.delete(image_ref)
+    except blob_store.BlobNotFound:
+        return "error", {"error": "Uploaded image expired or missing, please upload it again."}
     except Exception as e:
-        return {"error": f"Unable to open image: {str(e)}"}
-
-    max_size = 300
-    width, height = image.size
-    if width > height:
-        new_width = max_size
-        new_height = int((height / width) * max_size)
-    else:
-        new_height = max_size
-        new_width = int((width / height) * max_size)
+        return "error", {"error": f"Unable to open image: {str(e)}"}
 
     pre_resize = time.time()
-    resized_image = image.resize((new_width, new_height), Image.NEAREST)
+    with profiling.profile_stage("resize", timings):
+        resized_image = resize_image(image)
     post_resize = time.time()
-    result = analyze(resized_image)
+
+    if image_key is None:
+        image_key = result_cache.image_hash(resized_image)
+        cached_result = result_cache.result_cache.get(image_key)
+        if cached_result is not None:
+            return "cached", cached_result
+
+    if face_crop:
+        if pl is None:
+            load_models()
+        with profiling.profile_stage("face_crop", timings):
+            resized_image = resize_image(fcf.execute(image, device, verbose))
+
+    pre_analyze = time.time()
+    result = analyze(resized_image, timings=timings)
     post_analyze = time.time()
-    result["resize_time"] = str(post_resize - pre_resize)
-    result["analyze_time"] = str(post_analyze - post_resize)
+    result["decode_time"] = str(pre_resize - pre_decode)
+    result["resize_time"] = str(post_resize - pre_decode)
+    result["analyze_time"] = str(post_analyze - pre_analyze)
+    result["timings"] = timings
+    result_cache.result_cache.set(image_key, result)
+    return "success", result
+
+
+def save_profile_(profiler: profiling.SamplingProfiler) -> None:
+    task_id = process_image_task.request.id or str(int(1000 * time.time()))
+    filename = os.path.join(profile_path, task_id + ".folded")
+    try:
+        os.makedirs(profile_path, exist_ok=True)
+        profiler.save(filename)
+        print("Slow task profile saved to " + filename)
+    except OSError as e:
+        print("Slow task profile not saved: " + str(e))
+
+
+@celery_app.task(name="tasks.process_image_task")
+def process_image_task(image_ref, image_key: str = None) -> dict:
+    """
+    Celery task that receives a reference to the uploaded file in the blob store
+    (or, for tasks enqueued by older API versions, the raw file bytes), processes
+    the image, and returns the analysis result. The blob is deleted once decoded.
+    The result is stored in the result cache under the hash of the resized image;
+    if image_key is None, the cache is looked up first, otherwise the caller
+    already missed it for image_key. The returned resize_time covers both decoding
+    and resizing of the image, decode_time only the former. The returned timings
+    detail wall time, cpu time and peak memory of each stage of the task, which are
+    also recorded in the task metrics; tasks slower than profile_slow_threshold
+    seconds have their sampling profile saved to profile_path, if enabled.
+    """
+    timings = {}
+    status = "failure"  # an exception raised by the analysis
+    profiler = profiling.SamplingProfiler(profile_interval).start() if profile_slow_threshold > 0 else None
+
+    try:
+        with profiling.profile_stage("total", timings):
+            status, result = process_image_(image_ref, image_key, timings)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            if timings["total"]["wall_ms"] > 1000 * profile_slow_threshold:
+                save_profile_(profiler)
+        task_metrics.task_metrics.observe(status, timings)
+
     return result
+
+
+notifier_client = redis.Redis.from_url(result_notifier.notifier_url)
+
+
+@task_postrun.connect(sender=process_image_task)
+def publish_task_completion(task_id=None, retval=None, state=None, **kwargs):
+    """
+    Notifies the clients waiting for the task through the result notifier,
+    once its result has been stored in the result backend.
+    """
+    result_notifier.publish(notifier_client, task_id, state, retval)
@@ -80,6 +80,8 @@ def parse_retrieval_arguments(train=True):
     parser.add_argument("--order", default="unpaired", choices=["paired", "unpaired"], type=str)
     parser.add_argument("--query", default="dress", choices=["dress", "upper_body", "lower_body"], type=str)
     parser.add_argument("--k", default=5, type=int)
+    parser.add_argument("--index_path", default="retrieval/cloth_index/", type=str,
+                        help="Directory of the index of precomputed image embeddings")
 
     parser.add_argument('--batch_size', type=int, default=8)
     parser.add_argument('--workers', type=int, default=0)
@@ -142,3 +144,65 @@ def plot_random_examples(device, model, dataset, n_examples=1, figsize=(12, 6)):
         plt.title('Prediction')
         plt.imshow(from_DHW_to_HWD(
             color_processing.colorize_segmentation_masks(random_predictions[i], segmentation_labels.labels)))
+
+
+def parse_segmentation_batching_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='cloud', choices=['local', 'cloud'],
+                        help='Which segmentation model to use', metavar='')
+    parser.add_argument('--max_batch_size', type=int, default=8,
+                        help='Maximum number of images segmented together', metavar='')
+    parser.add_argument('--max_wait', type=float, default=0.01,
+                        help='Maximum time in seconds waited for further images after the first one of a batch',
+                        metavar='')
+    parser.add_argument('--n_requests', type=int, default=64,
+                        help='Number of requests sent at each concurrency level', metavar='')
+    args = parser.parse_args()
+    return args
+
+
+def parse_models_export_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='cloud', choices=['local', 'cloud'],
+                        help='Which segmentation model to export', metavar='')
+    parser.add_argument('--n_threads', type=int, nargs='+', default=[1, 2, 4],
+                        help='Intra-op thread counts to compare', metavar='')
+    parser.add_argument('--n_runs', type=int, default=10,
+                        help='Number of timed runs per image', metavar='')
+    args = parser.parse_args()
+    return args
+
+
+def parse_models_quantization_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_name', type=str, default='unet', choices=['unet', 'fastscnn'],
+                        help='Which model to quantize', metavar='')
+    parser.add_argument('--n_calibration_images', type=int, default=256,
+                        help='Number of images of the training partition used for calibration', metavar='')
+    parser.add_argument('--n_test_images', type=int, default=None,
+                        help='Number of images of the test partition used for evaluation (all if not set)',
+                        metavar='')
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--backend', type=str, default='fbgemm', choices=['fbgemm', 'qnnpack'],
+                        help='Quantized engine (fbgemm for x86 cpus, qnnpack for arm cpus)', metavar='')
+    args = parser.parse_args()
+    return args
+
+
+def parse_models_benchmark_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_names', type=str, nargs='+', default=list(model_names.MODEL_NAMES.keys()),
+                        choices=list(model_names.MODEL_NAMES.keys()), help='Which models to benchmark', metavar='')
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[128, 256, 512],
+                        help='Side of the (square) input images', metavar='')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 4, 8],
+                        help='Batch sizes of the inputs', metavar='')
+    parser.add_argument('--n_runs', type=int, default=20, help='Number of timed runs per configuration', metavar='')
+    parser.add_argument('--n_warmup', type=int, default=3, help='Number of untimed runs per configuration',
+                        metavar='')
+    parser.add_argument('--n_threads', type=int, default=None,
+                        help='Threads used for intra-op parallelism (PyTorch default if not set)', metavar='')
+    parser.add_argument('--output', type=str, default='models/benchmark_report.json',
+                        help='Path of the JSON report', metavar='')
+    args = parser.parse_args()
+    return args
@@ -0,0 +1,69 @@
+import glob
+import time
+import numpy as np
+import torch
+from PIL import Image
+from pipeline import segmentation_filter
+from utils import utils
+
+
+def latency_(sf, images, n_runs):
+    """
+    .. description::
+    Returns the average latency in milliseconds of segmentation filter sf over images, on cpu.
+    """
+    sf.execute_batch(images, 'cpu')  # warm-up, which also triggers optimizations of TorchScript graphs
+
+    clock_start = time.perf_counter()
+    for _ in range(n_runs):
+        for image in images:
+            sf.execute(image, 'cpu')
+    clock_end = time.perf_counter()
+
+    return 1000 * (clock_end - clock_start) / (n_runs * len(images))
+
+
+def main_worker(args):
+    example_images_path = 'palette_classification/example_images/'
+    max_size = 300
+
+    # bundled example images, resized as done by the API worker before analysis
+    images = []
+    for img_filename in sorted(glob.glob(example_images_path + '*.*')):
+        image = Image.open(img_filename).convert('RGB')
+        image.thumbnail((max_size, max_size), Image.NEAREST)
+        images.append(image)
+
+    # exports the TorchScript graph next to the weights if needed
+    eager_sf = segmentation_filter.SegmentationFilter(args.model, output='labels', backend='eager')
+    torchscript_sf = segmentation_filter.SegmentationFilter(args.model, output='labels', backend='torchscript')
+
+    # parity: logits of the TorchScript graph against the ones of the eager model, and resulting label maps
+    inputs = torch.stack([ eager_sf.transforms(eager_sf.pil_to_tensor(image) / 255) for image in images ])
+    with torch.no_grad():
+        eager_outputs = eager_sf.model.eval()(inputs)[0]
+    torchscript_outputs = torchscript_sf.backend(inputs)[0]
+
+    max_abs_diff = (eager_outputs - torchscript_outputs).abs().max().item()
+    label_agreement = np.mean([
+        (eager_label_map == torchscript_label_map).float().mean().item()
+        for (_, eager_label_map), (_, torchscript_label_map) in
+        zip(eager_sf.execute_batch(images, 'cpu'), torchscript_sf.execute_batch(images, 'cpu')) ])
+
+    print(f"Parity on {len(images)} example images: max abs logit difference {max_abs_diff:.2e}, "
+          f"label agreement {100 * label_agreement:.3f}%.")
+    assert(torch.allclose(eager_outputs, torchscript_outputs, rtol=1e-3, atol=1e-3))
+
+    # latency
+    print(f"{'backend':>12} {'threads':>8} {'ms/image':>9}")
+    for n_threads in args.n_threads:
+        torch.set_num_threads(n_threads)
+        eager_latency = latency_(eager_sf, images, args.n_runs)
+        torchscript_latency = latency_(torchscript_sf, images, args.n_runs)
+        print(f"{'eager':>12} {n_threads:>8} {eager_latency:>9.1f}")
+        print(f"{'torchscript':>12} {n_threads:>8} {torchscript_latency:>9.1f} ({eager_latency / torchscript_latency:.2f}x)")
+
+
+if __name__ == '__main__':
+    args = utils.parse_models_export_arguments()
+    main_worker(args)
@@ -0,0 +1,89 @@
+import os
+import time
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+from sklearn.model_selection import train_test_split
+from models.local.FastSCNN.models import fast_scnn
+from models.cloud.UNet import unet
+from models import config, dataset, quantization, training_and_testing
+from metrics_and_losses import metrics
+from slurm_scripts import slurm_config
+from utils import segmentation_labels, utils
+
+
+def latency_(model, input_size, n_runs=20):
+    """
+    .. description::
+    Returns the average latency in milliseconds of model on a single input of shape (1, 3, H, W), on cpu.
+    """
+    input = torch.rand((1, 3, *input_size))
+
+    with torch.no_grad():
+        model(input)  # warm-up
+        clock_start = time.perf_counter()
+        for _ in range(n_runs):
+            model(input)
+        clock_end = time.perf_counter()
+
+    return 1000 * (clock_end - clock_start) / n_runs
+
+
+def main_worker(args):
+    model_name = args.model_name
+    model_cfg = slurm_config.configurations['best'][model_name]
+    input_size = model_cfg['input_size']
+    weights_filename = config.WEIGHTS_PATH + model_name + '_ccncsa_best.pth'
+    quantized_filename = config.WEIGHTS_PATH + model_name + '_ccncsa_best_int8.torchscript.pt'
+    device = 'cpu'  # quantized models only run on cpu
+
+    # fetching dataset, with the same partitions used for training and testing
+    img_paths, label_paths = dataset.get_paths(config.DATASET_PATH, file_name=config.DATASET_INDEX_NAME)
+    X_train, X_test, Y_train, Y_test = train_test_split(
+        img_paths, label_paths, test_size=0.20, random_state=99, shuffle=True)
+    n_test_images = len(X_test) if args.n_test_images is None else args.n_test_images
+    calibration_dataset = dataset.CcncsaDataset(
+        X_train[:args.n_calibration_images], Y_train[:args.n_calibration_images],
+        model_cfg['image_transform_inference'], model_cfg['target_transform'])
+    test_dataset = dataset.CcncsaDataset(
+        X_test[:n_test_images], Y_test[:n_test_images],
+        model_cfg['image_transform_inference'], model_cfg['target_transform'])
+
+    # loading model
+    n_classes = len(segmentation_labels.labels)
+    if model_name == 'fastscnn':
+        model = nn.DataParallel(fast_scnn.FastSCNN(n_classes))
+    elif model_name == 'unet':
+        model = unet.UNet(out_channels=n_classes)
+    model.load_state_dict(torch.load(weights_filename, map_location=device))
+    model = model.module if isinstance(model, nn.DataParallel) else model
+
+    # quantizing model
+    calibration_loader = DataLoader(calibration_dataset, batch_size=args.batch_size, shuffle=False)
+    clock_start = time.time()
+    quantized_model = quantization.quantize_static(model, calibration_loader, backend=args.backend)
+    quantized_model = quantization.save_quantized(quantized_model, input_size, quantized_filename)
+    clock_end = time.time()
+    print(f'Calibrated on {len(calibration_dataset)} images and quantized in {clock_end - clock_start:.1f} seconds, '
+          f'saved to {quantized_filename}.')
+
+    # evaluating both models on test partition
+    fp32_mIoU = training_and_testing.test_model(device, model, test_dataset, args.batch_size, metrics.batch_mIoU)
+    int8_mIoU = training_and_testing.test_model(
+        device, quantized_model, test_dataset, args.batch_size, metrics.batch_mIoU)
+    fp32_latency = latency_(model, input_size)
+    int8_latency = latency_(quantized_model, input_size)
+    fp32_size = os.path.getsize(weights_filename) / 2 ** 20
+    int8_size = os.path.getsize(quantized_filename) / 2 ** 20
+
+    print(f'Evaluated on {len(test_dataset)} test images, threads: {torch.get_num_threads()}.')
+    print(f"{'model':>6} {'mIoU':>8} {'ms/image':>9} {'size MB':>8}")
+    print(f"{'fp32':>6} {fp32_mIoU.item():>8.4f} {fp32_latency:>9.1f} {fp32_size:>8.1f}")
+    print(f"{'int8':>6} {int8_mIoU.item():>8.4f} {int8_latency:>9.1f} {int8_size:>8.1f}")
+    print(f'mIoU drop: {fp32_mIoU.item() - int8_mIoU.item():.4f}, speedup: {fp32_latency / int8_latency:.2f}x, '
+          f'size reduction: {fp32_size / int8_size:.2f}x.')
+
+
+if __name__ == '__main__':
+    args = utils.parse_models_quantization_arguments()
+    main_worker(args)
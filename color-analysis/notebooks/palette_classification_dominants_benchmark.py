@@ -0,0 +1,54 @@
+import glob
+import time
+import torchvision.transforms as T
+from PIL import Image
+from pipeline import user_palette_classification_filter
+from palette_classification import color_processing, palette
+from utils import segmentation_labels
+
+
+def main_worker():
+    palettes_path = 'palette_classification/palettes/'
+    example_images_path = 'palette_classification/example_images/'
+    methods = ['kmeans', 'histogram']
+    n_runs = 5
+
+    reference_palettes = [ palette.PaletteRGB().load(filename.replace('\\', '/'), header=True)
+                           for filename in glob.glob(palettes_path + '*.csv') ]
+    filters = { method: user_palette_classification_filter.UserPaletteClassificationFilter(
+        reference_palettes, dominants_method=method) for method in methods }
+    pil_to_tensor = T.Compose([T.PILToTensor()])
+
+    # bundled example images, each with its ground truth segmentation (figN.png, figsegN.png)
+    img_filenames = sorted(set(glob.glob(example_images_path + 'fig*.png')) - 
+                           set(glob.glob(example_images_path + 'figseg*.png')))
+    
+    n_agreements = 0
+    total_latencies = { method: 0.0 for method in methods }
+
+    for img_filename in img_filenames:
+        img = pil_to_tensor(Image.open(img_filename).convert('RGB'))
+        img_segmented = pil_to_tensor(Image.open(img_filename.replace('fig', 'figseg')).convert('RGB'))
+        masks = color_processing.compute_segmentation_masks(img_segmented, segmentation_labels.labels)
+        seasons = {}
+
+        for method in methods:
+            clock_start = time.perf_counter()
+            for _ in range(n_runs):
+                user_palette = filters[method].execute((img, masks))
+            clock_end = time.perf_counter()
+
+            latency = (clock_end - clock_start) / n_runs
+            total_latencies[method] += latency
+            seasons[method] = user_palette.description()
+            print(f"{img_filename}: method '{method}' -> season '{seasons[method]}' in {1000 * latency:.1f} ms.")
+
+        n_agreements += seasons['kmeans'] == seasons['histogram']
+
+    for method in methods:
+        print(f"Average latency of method '{method}': {1000 * total_latencies[method] / len(img_filenames):.1f} ms.")
+    print(f"Season agreement between methods: {n_agreements}/{len(img_filenames)}.")
+
+
+if __name__ == '__main__':
+    main_worker()
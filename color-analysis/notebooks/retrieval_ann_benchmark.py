@@ -0,0 +1,67 @@
+import time
+import numpy as np
+import torch
+import open_clip
+from utils import utils, model_names
+from retrieval import embedding_index, training_and_testing_retrieval
+
+
+def benchmark_(index, queries, k, n_probe=None, rerank=0):
+    """
+    .. description::
+    Runs all queries (pytorch tensor of shape (n_queries, embedding_dim)) against index, exactly if n_probe is None
+    or approximately otherwise. Returns a tuple (retrieved_paths, average_latency_ms).
+    """
+    retrieved_paths = []
+    clock_start = time.perf_counter()
+
+    for query in queries:
+        paths, _ = index.search(query, k, n_probe=n_probe, rerank=rerank)
+        retrieved_paths.append(paths)
+
+    clock_end = time.perf_counter()
+    return retrieved_paths, 1000 * (clock_end - clock_start) / len(queries)
+
+
+def main_worker(args):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    clip_model = args.clip_model
+    pretrained = model_names.CLIP_MODELS_PRETRAINED[clip_model]
+    n_probes = [1, 2, 4, 8, 16, 32, 64]
+    rerank_factors = [0, 4]
+    n_image_queries = 200
+    k = args.k
+
+    model, _, _ = open_clip.create_model_and_transforms(clip_model, pretrained=pretrained)
+    tokenizer = open_clip.get_tokenizer(clip_model)
+
+    # the index is expected to be built on the test partition of DressCode Dataset (see retrieval_index_build.py)
+    index = embedding_index.ClothEmbeddingIndex(args.index_path).load()
+    if not index.has_ann():
+        print(f"Building approximate nearest neighbour index for {len(index)} images...")
+        index.build_ann()
+
+    # text queries, one per category, plus image queries sampled from the index itself
+    queries = [ training_and_testing_retrieval.compute_query_features(device, model, tokenizer, query)[0].to('cpu')
+                for query in ["dress", "upper_body", "lower_body"] ]
+    rng = np.random.default_rng(99)
+    sample = np.sort(rng.choice(len(index), min(n_image_queries, len(index)), replace=False))
+    queries += [ torch.from_numpy(np.array(embedding)) for embedding in index.embeddings()[sample] ]
+
+    exact_paths, exact_latency = benchmark_(index, queries, k)
+    print(f"Exact search over {len(index)} images, k = {k}: {exact_latency:.3f} ms/query.")
+    print(f"{'n_probe':>8} {'rerank':>8} {'recall@k':>10} {'ms/query':>10} {'speedup':>8}")
+
+    for rerank_factor in rerank_factors:
+        for n_probe in n_probes:
+            rerank = rerank_factor * k
+            approximate_paths, latency = benchmark_(index, queries, k, n_probe, rerank)
+            recall = np.mean([ len(set(exact) & set(approximate)) / len(exact)
+                               for exact, approximate in zip(exact_paths, approximate_paths) ])
+            print(f"{n_probe:>8} {rerank:>8} {recall:>10.3f} {latency:>10.3f} {exact_latency / latency:>7.1f}x")
+
+
+if __name__ == '__main__':
+    args = utils.parse_retrieval_arguments()
+
+    main_worker(args)
@@ -0,0 +1,31 @@
+import torch
+import open_clip
+from models.dataset import DressCodeDataset
+from utils import utils, model_names
+from retrieval import embedding_index
+
+
+def main_worker(args):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    clip_model = args.clip_model
+    pretrained = model_names.CLIP_MODELS_PRETRAINED[clip_model]
+    
+    model, _, preprocess = open_clip.create_model_and_transforms(clip_model, pretrained=pretrained)
+
+    dataset = DressCodeDataset(dataroot_path=args.dataroot,
+                               preprocess=preprocess,
+                               phase=args.phase,
+                               order=args.order)
+    
+    index = embedding_index.ClothEmbeddingIndex(args.index_path)
+    n_indexed = len(index.load()) if index.exists() else 0
+
+    print(f"Building index of clothes from DressCode Dataset in '{args.index_path}', using clip model {clip_model} (pretrained on {pretrained})...")
+    index.build(device, model, dataset, batch_size=args.batch_size, num_workers=args.workers, verbose=True)
+    print(f"The index contains {len(index)} images ({len(index) - n_indexed} added).")
+
+
+if __name__ == '__main__':
+    args = utils.parse_retrieval_arguments()
+
+    main_worker(args)
@@ -0,0 +1,90 @@
+import glob
+import threading
+import time
+import numpy as np
+import torch
+from PIL import Image
+from pipeline import segmentation_filter, batch_scheduler
+from utils import utils
+
+
+def run_requests_(segment_fn, images, n_requests, concurrency):
+    """
+    .. description::
+    Sends n_requests requests to segment_fn from concurrency threads, each request segmenting one of images.
+    Returns a tuple (throughput, latencies), where throughput is measured in requests per second and latencies
+    is a numpy array containing the latency of each request in milliseconds.
+    """
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(n_requests))
+
+    def client_():
+        while True:
+            with lock:
+                request_idx = next(counter, None)
+            if request_idx is None:
+                return
+
+            clock_start = time.perf_counter()
+            segment_fn(images[request_idx % len(images)])
+            clock_end = time.perf_counter()
+
+            with lock:
+                latencies.append(1000 * (clock_end - clock_start))
+
+    clients = [ threading.Thread(target=client_) for _ in range(concurrency) ]
+    clock_start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    clock_end = time.perf_counter()
+
+    return n_requests / (clock_end - clock_start), np.array(latencies)
+
+
+def main_worker(args):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    example_images_path = 'palette_classification/example_images/'
+    concurrency_levels = [1, 2, 4, 8, 16]
+    max_size = 300
+
+    # bundled example images, resized as done by the API worker before analysis
+    images = []
+    for img_filename in sorted(glob.glob(example_images_path + '*.*')):
+        image = Image.open(img_filename).convert('RGB')
+        image.thumbnail((max_size, max_size), Image.NEAREST)
+        images.append(image)
+
+    sf = segmentation_filter.SegmentationFilter(args.model, output='labels')
+    scheduler = batch_scheduler.MicroBatchScheduler(
+        lambda batch: sf.execute_batch(batch, device), max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+
+    # without batching, the worker runs one batch-1 forward pass at a time
+    model_lock = threading.Lock()
+    def segment_unbatched_(image):
+        with model_lock:
+            return sf.execute(image, device)
+
+    # warm-up
+    sf.execute_batch(images, device)
+
+    print(f"Model: {args.model}, device: {device}, max batch size: {args.max_batch_size}, "
+          f"max wait: {1000 * args.max_wait:.1f} ms, requests per level: {args.n_requests}.")
+    print(f"{'concurrency':>11} {'mode':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'avg batch':>10}")
+
+    for concurrency in concurrency_levels:
+        for mode, segment_fn in [('unbatched', segment_unbatched_), ('batched', scheduler)]:
+            n_batches, n_inputs = scheduler.n_batches_, scheduler.n_inputs_
+            throughput, latencies = run_requests_(segment_fn, images, args.n_requests, concurrency)
+            average_batch_size = (scheduler.n_inputs_ - n_inputs) / max(scheduler.n_batches_ - n_batches, 1) \
+                if mode == 'batched' else 1.0
+
+            print(f"{concurrency:>11} {mode:>10} {throughput:>8.2f} {np.percentile(latencies, 50):>8.1f} "
+                  f"{np.percentile(latencies, 95):>8.1f} {average_batch_size:>10.2f}")
+
+
+if __name__ == '__main__':
+    args = utils.parse_segmentation_batching_arguments()
+    main_worker(args)